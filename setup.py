@@ -11,6 +11,7 @@ setup(
     keywords=['vlbi', 'vcc'],
     install_requires=['requests', 'sshtunnel', 'toml', 'psutil', 'pexpect', 'setuptools',
                       'pycryptodome', 'pyjwt', 'urllib3', 'tabulate', 'tkcalendar'],
+    extras_require={'numpy': ['numpy']},
     include_package_data=True,
     package_data={'': ['images/info.png', 'images/warning.png', 'images/urgent.png']},
     entry_points={
@@ -18,6 +19,7 @@ setup(
             'vcc=vcc.__main__:main',
             'vccns=vcc.ns.__main__:main',
             'message-box=vcc.windows:main',
+            'vcc-notifier=vcc.notifier:main',
             'fslog=vcc.fslog:main',
             'sessions-wnd=vcc.tools:main',
             'dashboard=vcc.__main__:main',
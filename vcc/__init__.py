@@ -4,11 +4,13 @@ import logging.handlers
 import os
 import sys
 import platform
+import shutil
 from base64 import urlsafe_b64decode as b64d
 from base64 import urlsafe_b64encode as b64e
 from datetime import date, datetime
 from pathlib import Path
 from subprocess import Popen, PIPE
+from threading import Thread
 import hashlib
 import psutil
 
@@ -123,17 +125,35 @@ class DebugFilter(logging.Filter):
 
 
 # Set default logger
-def set_logger(log_path='', prefix='', console=False, size=1000000):
+def set_logger(log_path='', prefix='', console=False, size=1000000, level=9, keep=30):
     # Functions needed to provide name of new compress file
     def namer(name):
         folder = Path(name).parent
         return Path(folder, datetime.utcnow().strftime(f'{prefix}%Y-%m-%d.%H%M%S.gz'))
 
-    # Functions needed to created file rotator with gzip compression
+    # Compress by blocks. Only the most recent archives are kept (all of them if keep is 0)
+    def compress(source, destination):
+        tmp = destination.with_suffix('.tmp')
+        try:
+            with open(source, 'rb') as sf, gzip.open(tmp, 'wb', compresslevel=level) as df:
+                shutil.copyfileobj(sf, df, 1024 * 1024)
+            os.replace(tmp, destination)
+            os.remove(source)
+        except OSError as exc:
+            tmp.unlink(missing_ok=True)
+            logging.getLogger('vcc').warning(f'could not compress {source} [{str(exc)}]')
+            return
+        pattern = f'{prefix}[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9].[0-9]*.gz'
+        for path in sorted(destination.parent.glob(pattern))[:-keep] if keep else []:
+            path.unlink(missing_ok=True)
+
+    # Functions needed to created file rotator with gzip compression. Log is renamed so that
+    # logging can continue while it is compressed in another thread.
     def rotator(source, destination):
-        with open(source, "rb") as sf, open(destination, "wb") as df:
-            df.write(gzip.compress(sf.read(), 9))
-        os.remove(source)
+        destination = Path(destination)
+        rotated = destination.with_suffix('.log')
+        os.rename(source, rotated)
+        Thread(target=compress, args=(rotated, destination), name='log-compress').start()
 
     logger = logging.getLogger('vcc')
     logger.setLevel(logging.DEBUG)
@@ -173,6 +193,11 @@ def get_ns_code(config):
 
 
 def vcc_cmd(action, options, user=None, group=None, env=None):
+    # Message box is displayed by resident notifier when one is running for the display
+    if action == 'message-box' and platform.system() != "Windows":
+        from vcc.notifier import send_popup
+        if send_popup(options, user=user, env=env):
+            return
     env = dict(**os.environ.copy(), **(env or {}))
     cmd = str(Path(Path(sys.argv[0]).parent, action))
     if platform.system() == "Windows":
@@ -216,7 +241,79 @@ def get_md5sum(path, chunk_size=32768):
     return md5.hexdigest()
 
 
+# Folder where running inboxes and notifiers register their display
+def inbox_registry():
+    return Path(Path(sys.prefix).parent, 'messages', 'inboxes')
+
+
+# Register inbox for display. The lock is kept until inbox ends so that other processes can detect stale entries.
+# Return the open registration file or None if an inbox is already registered for this display.
+def register_inbox(display):
+    return register_display(display, 'pid')
+
+
+# Register process using display (kind is pid for inbox, notifier for notifier)
+def register_display(display, kind):
+    import fcntl
+
+    try:
+        (folder := inbox_registry()).mkdir(exist_ok=True)
+    except OSError:
+        return None
+    path = Path(folder, f"{display.replace('/', '_')}.{kind}")
+    for _ in range(3):
+        file = open(path, 'a+')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return None
+        # File could have been removed as stale before it was locked
+        if path.exists() and path.stat().st_ino == os.fstat(file.fileno()).st_ino:
+            file.seek(0)
+            file.truncate()
+            file.write(f'{os.getpid()} {display}\n')
+            file.flush()
+            try:
+                path.chmod(0o664)
+            except OSError:
+                pass
+            return file
+        file.close()
+    return None
+
+
+# Displays and pids of running inboxes
+def registered_inboxes():
+    return registered_displays('pid')
+
+
+# Displays and pids of running processes of kind. Registration files that are not locked anymore are removed.
+def registered_displays(kind):
+    import fcntl
+
+    inboxes = {}
+    if not (folder := inbox_registry()).exists():
+        return inboxes
+    for path in folder.glob(f'*.{kind}'):
+        try:
+            with open(path) as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except OSError:  # Locked by running inbox
+                    pid, display = file.read().split(maxsplit=1)
+                    inboxes[display.strip()] = int(pid)
+                else:
+                    path.unlink()
+        except (OSError, ValueError):
+            pass
+    return inboxes
+
+
+# Get running inboxes from registry. Scan all processes only if registry is empty.
 def get_inboxes(pid=None):
+    if inboxes := registered_inboxes():
+        return {display: prc for display, prc in inboxes.items() if prc != pid}
     inboxes = {}
     for index, prc in enumerate(psutil.process_iter()):
         try:
@@ -2,7 +2,7 @@ import argparse
 import sys
 from pathlib import Path
 
-from vcc import help, settings, show_version
+from vcc import help, settings, show_version, set_logger
 from vcc.client import VCC
 from vcc.dashboard import Dashboard
 from vcc.downtime import downtime
@@ -49,6 +49,13 @@ def session_args():
     return parser.parse_args(filter_input())
 
 
+# Log file defined in Logs section of config file. Rotated logs are compressed and only 'keep' archives are kept
+def start_logger():
+    if log := getattr(settings, 'Logs', None):
+        set_logger(log.path, getattr(log, 'prefix', ''), size=getattr(log, 'size', 1000000),
+                   level=getattr(log, 'level', 9), keep=getattr(log, 'keep', 30))
+
+
 def filter_input():
     name = Path(sys.argv[0]).name
     param = [] if name == 'vcc' else [name]
@@ -111,6 +118,7 @@ def main():
     try:
         args = parser.parse_args(filter_input())
         settings.init(args)
+        start_logger()
         if args.action == 'version':  # Show version
             show_version()
         elif args.action == 'test':  # Run VCC test for config file
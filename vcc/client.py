@@ -20,6 +20,8 @@ from sshtunnel import (BaseSSHTunnelForwarderError,
                        HandlerSSHTunnelForwarderError, SSHTunnelForwarder)
 
 from vcc import (VCCError, json_encoder, make_object, settings, vcc_groups)
+from vcc import metrics
+from vcc.metrics import endpoint
 
 logger = logging.getLogger('vcc')
 
@@ -28,22 +30,27 @@ def http_retry(max_attempts=3, delay=0.1):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(self, *args, **kwargs):
-            attempts = 0
+            attempts, labels = 0, {'method': func.__name__, 'endpoint': endpoint(args[0] if args else '/')}
             while attempts < max_attempts:
                 try:
-                    return func(self, *args, **kwargs)
+                    start = time.perf_counter()
+                    rsp = func(self, *args, **kwargs)
+                    metrics.requests_latency.observe(time.perf_counter() - start, **labels)
+                    return rsp
                 except (requests.exceptions.ConnectionError, AttributeError):
                     attempts += 1
+                    metrics.requests_retries.inc(**labels)
                     self.http_session = requests.session()  # reset Session
                     time.sleep(delay)
+            metrics.requests_failures.inc(**labels)
             raise VCCError('connection error')
 
         return wrapper
     return decorator
 
 
-def load_private_key():
-    with open(settings.RSAkey.path, 'rb') as f:
+def load_private_key(path=None):
+    with open(path or settings.RSAkey.path, 'rb') as f:
         return serialization.load_ssh_private_key(f.read(), password=None)
 
 
@@ -104,6 +111,7 @@ class VCC:
             self.tunnel.check_tunnels()
             if not self.tunnel.tunnel_is_up:
                 self.tunnel.restart()
+                metrics.tunnel_restarts.inc()
             return self.name, self.tunnel
         tunnel = SSHTunnelForwarder(config.url, ssh_username=config.tunnel, ssh_pkey=config.key,
                                     remote_bind_address=('localhost', config.port))
@@ -195,6 +203,12 @@ class VCC:
         rsp = self.http_session.delete(url=urljoin(self.base_url, path), headers=headers)
         return self.validate_signature(rsp)
 
+    # Client using same tunnel and http session, signing requests with another identity.
+    # VCC validates the signature with the public key registered for uid. Without key, the private key of this
+    # client is used, so the NS public key must also be registered for uid.
+    def identity(self, code, uid, key=None):
+        return Identity(self, code, uid, key)
+
     def copy(self):
         second = VCC(self.group_id)
         second.tunnel, second.protocol, second.url, second.port = self.tunnel, self.protocol, self.url, self.port
@@ -203,6 +217,36 @@ class VCC:
         return second
 
 
+# Client signing requests with its own code and uid but using the connection of main client. Requests of all
+# identities go through the same pooled http session. A session reset after a connection error is used by all.
+class Identity(VCC):
+    def __init__(self, main, code, uid, key=None):
+        self.main, self.group_id, self.code, self.uid = main, main.group_id, code, uid
+        self.secret_key, self.jwt_data = str(uuid.uuid4()), None
+        self.private_key = load_private_key(key) if key else main.private_key
+
+    # Connection parameters (tunnel, url, base_url...) are those of main client
+    def __getattr__(self, name):
+        if name == 'main':
+            raise AttributeError(name)
+        return getattr(self.main, name)
+
+    @property
+    def http_session(self):
+        return self.main.http_session
+
+    @http_session.setter
+    def http_session(self, session):
+        self.main.http_session = session
+
+    def connect(self):
+        self.main.connect()
+
+    # Connection is closed by main client
+    def close(self):
+        pass
+
+
 def get_server():
     def _decode(item):
         try:
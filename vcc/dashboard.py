@@ -1,4 +1,5 @@
 import json
+import logging
 import traceback
 import time
 import math
@@ -15,8 +16,11 @@ import requests
 from vcc import settings, VCCError, json_decoder, vcc_cmd
 from vcc.client import VCC
 from vcc.session import Session
+from vcc.skd import find_schedule, local_summary
 from vcc.windows import MessageBox
 
+logger = logging.getLogger('vcc')
+
 
 class InboxWatcher(threading.Thread):
 
@@ -378,11 +382,38 @@ class Dashboard(tk.Tk):
         except VCCError:
             pass
 
+    # Summary of schedule from VCC. Summary made from local file has more details and is used instead when the file
+    # is not older than the version on VCC, or when VCC cannot be reached. Versions are only known by VCC.
+    def read_summary(self, local=True):
+        remote = None
+        try:
+            if rsp := self.vcc.get(f'/schedules/{self.session.code.lower()}', params={'select': 'summary'}):
+                remote = json_decoder(rsp.json())
+        except VCCError as exc:
+            logger.warning(f'schedule summary not available from VCC [{str(exc)}]')
+        if not local or not (path := find_schedule(self.session.code)):
+            return remote
+        if remote and isinstance(updated := remote.get('updated'), datetime) \
+                and datetime.utcfromtimestamp(path.stat().st_mtime) < updated:
+            logger.info(f'{path.name} is older than schedule version {remote.get("version")} on VCC')
+            return remote
+        try:
+            summary = local_summary(path)
+        except Exception as exc:
+            logger.warning(f'local summary of {path.name} failed [{str(exc)}]')
+            return remote
+        if remote:
+            summary['version'], summary['updated'] = remote.get('version', 0), remote.get('updated')
+            versions = {info['station']: info.get('version', 0) for info in remote.get('scheduled', [])}
+            for info in summary['scheduled']:
+                info['version'] = versions.get(info['station'], 0)
+        return summary
+
     def _get_schedule(self):
         for n in range(3):
             try:
-                if rsp := self.vcc.get(f'/schedules/{self.session.code.lower()}', params={'select': 'summary'}):
-                    self.session.update_schedule(json_decoder(rsp.json()))
+                if summary := self.read_summary():
+                    self.session.update_schedule(summary)
                     self.schedule.set(self.session.sched_version)
                     self.scans = {info['station']: {'last': 0, 'total': info['nbr_scans'], 'version': info['version'],
                                                     'list': set()}
@@ -396,10 +427,10 @@ class Dashboard(tk.Tk):
             except VCCError:
                 pass
 
-    def get_schedule(self):
+    def get_schedule(self, local=True):
         try:
-            if rsp := self.vcc.get(f'/schedules/{self.session.code.lower()}', params={'select': 'summary'}):
-                self.session.update_schedule(json_decoder(rsp.json()))
+            if summary := self.read_summary(local):
+                self.session.update_schedule(summary)
                 self.schedule.set(self.session.sched_version)
                 self.scans = {info['station']: {'last': 0, 'total': info['nbr_scans'], 'version': info['version'],
                                                 'list': set()} for info in self.session.schedule.scheduled}
@@ -491,8 +522,9 @@ class Dashboard(tk.Tk):
         subject = 'Message from VCC'
         MessageBox(self, subject, msg, icon='urgent')
 
+    # Local file could be the previous version
     def process_schedule(self, headers, data):
-        threading.Thread(target=self.get_schedule).start()
+        threading.Thread(target=self.get_schedule, args=(False,)).start()
 
     def process_urgent(self, headers, data):
         subject = f'Urgent message from {data["fr"]}'
@@ -16,8 +16,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox, TclError
 from tkinter import font
 
-from vcc import settings, VCCError, json_encoder, json_decoder, vcc_groups, get_inboxes
+from vcc import settings, VCCError, json_encoder, json_decoder, vcc_groups, get_inboxes, register_inbox
 from vcc.client import VCC
+from vcc.store import MessageStore
 from vcc.windows import MessageBox
 from vcc.xtools import Sessions
 from vcc.xwidget import XEntry, FakeEntry
@@ -104,6 +105,8 @@ class ScheduleMsg(BaseMessage):
     def show(self, parent, group_id):
         status = 'updated' if self._data['version'] > 1.01 else 'ready'
         msg = f"{self._msg}\n\nSchedule updated at {self._data['updated']:%Y-%m-%d %H:%M:%S} UTC"
+        if changes := self._data.get('changes'):
+            msg = f"{msg}\n\nChanges from previous version<br>{changes}"
         if extra := self._data.get('processed'):
             msg = f"{msg}\n\n{extra}"
         MessageBox(parent, f"{self._data['session']} schedule {status}", msg, icon='urgent')
@@ -332,7 +335,6 @@ class Messages(ttk.Treeview):
             with open(user_file) as f:
                 data = json_decoder(json.loads(f.read()))
                 self.last = data['last']
-                print(f"last {self.last} {type(self.last)}")
                 if records := data['records']:
                     for utc, code, status, data in sorted(records, key=itemgetter(0)):
                         item = self.add_item(make_msg_record(utc, code, status, data))
@@ -340,26 +342,21 @@ class Messages(ttk.Treeview):
         self.selection_set(item)
         self.see(item)
 
-    def read_group_messages(self, group_file):
-        if group_file.exists():
-            with open(group_file) as f:
-                records = []
-                for headers, info in json_decoder((json.loads(f.read()))):
-                    print(f"last {self.last} {type(self.last)}")
-                    print(f"utc {headers['utc']} {type(headers['utc'])}")
-                    if (utc := headers['utc']) > self.last:
-                        status = 'urgent' if headers['code'] == 'urgent' else 'unread'
-                        records.append((utc, headers['code'], status, info))
-                if records:
-                    records = [make_msg_record(*data) for data in sorted(records, key=itemgetter(0))]
-                    for record in records[:-1]:
-                        self.add_item(record)
-                    item = self.add_item(records[-1], new_msg=True)
-                    self.last = records[-1].datetime()
-                    print(f"last record {self.last} {type(self.last)}")
-
-                    self.selection_set(item)
-                    self.see(item)
+    def read_group_messages(self, messages):
+        records = []
+        for headers, info in messages:
+            if (utc := headers['utc']) > self.last:
+                status = 'urgent' if headers['code'] == 'urgent' else 'unread'
+                records.append((utc, headers['code'], status, info))
+        if records:
+            records = [make_msg_record(*data) for data in sorted(records, key=itemgetter(0))]
+            for record in records[:-1]:
+                self.add_item(record)
+            item = self.add_item(records[-1], new_msg=True)
+            self.last = records[-1].datetime()
+
+            self.selection_set(item)
+            self.see(item)
 
     def save(self, archive):
         with (open(archive, 'w') as ar):
@@ -380,6 +377,8 @@ class InboxWnd(tk.Tk):
                     print(f'Inbox already running for {display}')
                     exit(0)
 
+            # Register so that vccmon finds this inbox without scanning all processes
+            self.registration = register_inbox(display) if display else None
             print(f'Start using {display}')
             super().__init__(screenName=display)
         except TclError as exc:
@@ -395,9 +394,9 @@ class InboxWnd(tk.Tk):
         signal.signal(signal.SIGUSR1, self.goto_top)
 
         self.hidden = Path(Path(sys.prefix).parent, 'messages')
-        self.last_modified = 0
 
         self.group_id, self.interval = group_id.upper(), interval
+        self.store = MessageStore(self.grp_archive, legacy=Path(self.hidden, f'{self.group_id.lower()}.json'))
         self.protocol("WM_DELETE_WINDOW", self.done)
         self.records, self.record_id, self.messages = {}, 0, None
         self.utc = tk.StringVar()
@@ -436,8 +435,7 @@ class InboxWnd(tk.Tk):
         # Add a Treeview widget
         self.messages = Messages(frame)
         self.messages.read(self.user_archive)
-        self.messages.read_group_messages(self.grp_archive)
-        self.last_modified = self.get_last_mofified()
+        self.messages.read_group_messages(self.store.read_new(self.messages.last))
 
         self.messages.bind('<Double-1>', self.double_clicked)
         self.messages.bind('<Button-3>', self.popup_menu)
@@ -461,9 +459,6 @@ class InboxWnd(tk.Tk):
         frame.pack(expand=tk.NO, fill=tk.BOTH)
         return frame
 
-    def get_last_mofified(self):
-        return self.grp_archive.stat().st_mtime if self.grp_archive.exists() else 0
-
     @property
     def user_archive(self):
         if self.group_id == 'NS':
@@ -472,12 +467,12 @@ class InboxWnd(tk.Tk):
 
     @property
     def grp_archive(self):
-        return Path(self.hidden, f"{self.group_id.lower()}.json")
+        return Path(self.hidden, f"{self.group_id.lower()}.jsonl")
 
+    # Only records appended since last call are read
     def new_messages(self):
-        if (last_modified := self.get_last_mofified()) > self.last_modified:
-            self.messages.read_group_messages(self.grp_archive)
-            self.last_modified = last_modified
+        if records := self.store.read_new(self.messages.last):
+            self.messages.read_group_messages(records)
         dt = time.time() % 1
         waiting_time = 1.0 if dt < 0.001 else 1.0 - dt
         self.after(int(waiting_time*1000), self.new_messages)
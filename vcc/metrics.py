@@ -0,0 +1,189 @@
+import logging
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread, Event, Lock
+
+"""
+Metrics of vcc processes in Prometheus text format.
+Counters and histograms are updated where events happen. Values of components that already count what they do
+(onoff spool, inbox pool, prefetch...) are read from their metrics() function when metrics are exported.
+Collected values are gauges, except names ending with _total which are counters.
+Metrics are written in a file for the node_exporter textfile collector or served on localhost.
+"""
+
+logger = logging.getLogger('vcc')
+
+
+# Path of request without session, station or file names so that number of series stays small
+def endpoint(path):
+    names = path.split('?')[0].split('/')
+    return '/'.join(names[:3]) if names[1:2] in (['messages'], ['data']) else '/'.join(names[:2]) or '/'
+
+
+def labels_text(labels):
+    return '{' + ','.join([f'{key}="{val}"' for key, val in labels]) + '}' if labels else ''
+
+
+class Counter:
+    def __init__(self, name, text):
+        self.name, self.text, self.lock = name, text, Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, value=1, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] += value
+
+    def lines(self):
+        with self.lock:
+            values = list(self.values.items())
+        return [f'# HELP {self.name} {self.text}', f'# TYPE {self.name} counter'] + \
+            [f'{self.name}{labels_text(labels)} {value:g}' for labels, value in values]
+
+
+class Histogram:
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, text, buckets=None):
+        self.name, self.text, self.lock = name, text, Lock()
+        self.buckets = tuple(buckets or self.buckets)
+        self.values = {}  # labels: [counts per bucket, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def lines(self):
+        with self.lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self.values.items()]
+        lines = [f'# HELP {self.name} {self.text}', f'# TYPE {self.name} histogram']
+        for labels, counts, total in values:
+            cumulative = 0
+            for limit, count in zip([f'{limit:g}' for limit in self.buckets] + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{labels_text(labels + (("le", limit),))} {cumulative}')
+            lines.append(f'{self.name}_sum{labels_text(labels)} {total:.6f}')
+            lines.append(f'{self.name}_count{labels_text(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    prefix = 'vcc_'
+
+    def __init__(self):
+        self.metrics, self.collectors, self.lock = {}, [], Lock()
+
+    def counter(self, name, text):
+        return self.add(Counter(f'{self.prefix}{name}', text))
+
+    def histogram(self, name, text, buckets=None):
+        return self.add(Histogram(f'{self.prefix}{name}', text, buckets))
+
+    def add(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    # Function returning dictionary of values. Labels are added to all values
+    def collect(self, function, **labels):
+        with self.lock:
+            self.collectors.append((function, tuple(sorted(labels.items()))))
+
+    def render(self):
+        with self.lock:
+            metrics, collectors = list(self.metrics.values()), list(self.collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.lines())
+        values = defaultdict(list)
+        for function, labels in collectors:
+            try:
+                for name, value in function().items():
+                    values[f'{self.prefix}{name}'].append((labels, value))
+            except Exception as exc:
+                logger.warning(f'metrics {function.__qualname__} failed [{str(exc)}]')
+        for name, items in values.items():
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.extend([f'{name}{labels_text(labels)} {float(value):g}' for labels, value in items])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+requests_latency = registry.histogram('request_seconds', 'Time to get answer from VCC')
+requests_retries = registry.counter('request_retries_total', 'Requests retried after connection error')
+requests_failures = registry.counter('request_failures_total', 'Requests failed after all retries')
+tunnel_restarts = registry.counter('tunnel_restarts_total', 'SSH tunnel restarts')
+
+
+# Write metrics in file read by node_exporter textfile collector
+class TextfileExporter(Thread):
+    def __init__(self, path, interval=15):
+        super().__init__(name='metrics', daemon=True)
+        self.path, self.interval, self.stopped = Path(path), interval, Event()
+
+    def write(self):
+        try:
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                f.write(registry.render())
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            logger.warning(f'metrics not written [{str(exc)}]')
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+        self.write()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class MetricsRequest(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        data = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+# Serve metrics on localhost only
+class HTTPExporter(Thread):
+    def __init__(self, port, host='127.0.0.1'):
+        super().__init__(name='metrics', daemon=True)
+        self.server = ThreadingHTTPServer((host, port), MetricsRequest)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Start exporter defined in Metrics section of config file. Return None if none is defined
+def start_exporter(config):
+    try:
+        if path := getattr(config, 'textfile', None):
+            exporter = TextfileExporter(path, getattr(config, 'interval', 15))
+        elif port := getattr(config, 'port', None):
+            exporter = HTTPExporter(int(port))
+        else:
+            return None
+        exporter.start()
+        return exporter
+    except (OSError, ValueError) as exc:
+        logger.warning(f'metrics exporter not started [{str(exc)}]')
+        return None
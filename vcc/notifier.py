@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import queue
+import shlex
+import socket
+import sys
+import tempfile
+from pathlib import Path
+from threading import Thread
+
+"""
+Resident notifier displaying message boxes for one display.
+vcc_cmd('message-box', ...) sends the request to the notifier through a Unix socket when one is running
+for the display, instead of starting a new interpreter and Tk for each popup.
+"""
+
+
+# User id of user (current user by default)
+def user_id(user=None):
+    if user:
+        import pwd
+        return pwd.getpwnam(user).pw_uid
+    return os.getuid()
+
+
+# Path of notifier socket for display and user. Sockets are in a folder only accessible by the user.
+def socket_path(display, user=None):
+    folder = Path(tempfile.gettempdir(), f'vcc-notifier-{user_id(user)}')
+    return Path(folder, f"{display.replace('/', '_')}.sock")
+
+
+# Check that folder belongs to uid and is not accessible by others
+def is_private(folder, uid):
+    info = folder.lstat()
+    return folder.is_dir() and not folder.is_symlink() and info.st_uid == uid and not info.st_mode & 0o077
+
+
+def message_parser():
+    parser = argparse.ArgumentParser(description='Display message', prog='message-box', add_help=False)
+    parser.add_argument('-t', '--title', help='title', default='')
+    parser.add_argument('-m', '--message', help='message', default='')
+    parser.add_argument('-i', '--icon', help='icon', default='info')
+    parser.add_argument('-D', '--display', help='display', required=False)
+    return parser
+
+
+# Send message-box options to notifier. Return False if no notifier is running for the display
+def send_popup(options, user=None, env=None):
+    if not hasattr(socket, 'AF_UNIX'):
+        return False
+    try:
+        args, _ = message_parser().parse_known_args(shlex.split(options))
+        if not (display := args.display or (env or {}).get('DISPLAY') or os.environ.get('DISPLAY')):
+            return False
+        if not (path := socket_path(display, user)).exists() or not is_private(path.parent, user_id(user)):
+            return False
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(str(path))
+            request = {'title': args.title, 'message': args.message, 'icon': args.icon}
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        return True
+    except (OSError, ValueError, KeyError, SystemExit):
+        return False
+
+
+class Notifier:
+
+    def __init__(self, display, max_boxes=20):
+        import tkinter as tk
+
+        self.display, self.max_boxes = display, max_boxes
+        self.path = socket_path(display)
+        self.requests, self.boxes = queue.Queue(), []
+        self.root = tk.Tk(screenName=display)
+        self.root.withdraw()
+        self.server = None
+
+    # Check if another notifier is answering on socket. Remove socket if stale.
+    def is_running(self):
+        if not self.path.exists():
+            return False
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(self.path))
+                return True
+            except OSError:
+                self.path.unlink(missing_ok=True)
+        return False
+
+    # Receive requests from clients. One json request per connection
+    def listen(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+                with conn, conn.makefile('rb') as f:
+                    if line := f.readline():
+                        self.requests.put(json.loads(line))
+            except (OSError, ValueError):
+                if self.server.fileno() < 0:
+                    return
+
+    # Display requested message boxes in Tk loop. Oldest boxes are closed when there are too many.
+    def show(self):
+        from vcc.windows import MessageBox
+
+        while not self.requests.empty():
+            request = self.requests.get()
+            self.boxes = [box for box in self.boxes if box.winfo_exists()]
+            if len(self.boxes) >= self.max_boxes:
+                self.boxes.pop(0).destroy()
+            self.boxes.append(MessageBox(self.root, request.get('title', ''), request.get('message', ''),
+                                         request.get('icon', 'info')))
+        self.root.after(50, self.show)
+
+    def exec(self):
+        from vcc import register_display
+
+        if self.is_running():
+            print(f'notifier already running for {self.display}')
+            return
+        self.path.parent.mkdir(mode=0o700, exist_ok=True)
+        if not is_private(self.path.parent, os.getuid()):
+            print(f'{self.path.parent} is not a private folder')
+            return
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)  # Socket is never accessible by others, even before bind returns
+        try:
+            self.server.bind(str(self.path))
+        finally:
+            os.umask(umask)
+        self.server.listen()
+        Thread(target=self.listen, daemon=True).start()
+        # Registered display is found by vccmon without scanning processes. Lock is released when notifier ends.
+        registration = register_display(self.display, 'notifier')
+        try:
+            self.root.after(50, self.show)
+            self.root.mainloop()
+        finally:
+            self.server.close()
+            self.path.unlink(missing_ok=True)
+            if registration:
+                registration.close()
+
+
+def main():
+    import tkinter
+
+    parser = argparse.ArgumentParser(description='Resident notifier for VCC message boxes', prog='vcc-notifier')
+    parser.add_argument('-D', '--display', help='display', default=os.environ.get('DISPLAY'))
+    parser.add_argument('-n', '--max-boxes', help='maximum number of open boxes', type=int, default=20)
+
+    args = parser.parse_args()
+    if not args.display:
+        print('no display')
+        return 1
+    try:
+        Notifier(args.display, args.max_boxes).exec()
+    except tkinter.TclError as exc:
+        print(f'notifier fatal error - {str(exc)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -9,18 +9,21 @@ from subprocess import Popen, PIPE
 
 from psutil import process_iter, AccessDenied, NoSuchProcess
 
-from vcc import settings, vcc_cmd
+from vcc import settings, vcc_cmd, registered_inboxes, registered_displays
 
 
 logger = logging.getLogger('vcc')
 get_file_name = re.compile('.*filename=\"(?P<name>.*)\".*').match
 
 
-# Get all displays for oper users.
+# Get all displays for oper users. Displays of registered inboxes and notifiers are used.
+# All processes are scanned only if none is registered.
 def get_displays(display=None):
 
     if display:
         return [display]
+    if displays := set(registered_inboxes()) | set(registered_displays('notifier')):
+        return list(displays)
     displays = []
     for prc in psutil.process_iter():
         try:
@@ -54,10 +57,11 @@ def show_sessions(title, sessions, option='', display=None):
 PATH = ':'.join(["/usr2/st/bin", "/usr2/fs/bin", os.environ.get('PATH')])
 
 
-def get_ddout_log():
+# Get active log of FS. lognm and folder can be set for stations running FS from other folder than /usr2
+def get_ddout_log(lognm='lognm', folder='/usr2/log'):
     try:
-        output, _ = Popen(['lognm'], env={'PATH': PATH}, stdout=PIPE).communicate()
-        return Path('/usr2/log', f"{name}.log") if (name := output.decode('utf-8').strip()) else None
+        output, _ = Popen([lognm], env={'PATH': PATH}, stdout=PIPE).communicate()
+        return Path(folder, f"{name}.log") if (name := output.decode('utf-8').strip()) else None
     except FileNotFoundError as exc:
         logger.warning(str(exc))
         return None
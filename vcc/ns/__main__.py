@@ -31,6 +31,8 @@ def main():
     # DRUDG subprocess
     sub = sub_parser(subparsers, 'drudg', help='Run DRUDG')
     sub.add_argument('-v', '--vex', help='use vex file', action='store_true', required=False)
+    sub.add_argument('-f', '--force', help='run drudg even if outputs are cached', action='store_true',
+                     required=False)
     sub.add_argument('session', help='session code')
     # LOG subprocess
     sub = sub_parser(subparsers, 'log', help='Upload log file)')
@@ -60,7 +62,7 @@ def main():
         if not (sta_id := settings.get_user_code('NS')):
             print('Only Network Station can run this application')
         elif args.action == 'drudg':
-            drudg_it(args.session, args.vex)
+            drudg_it(args.session, args.vex, not args.force)
         elif args.action == 'log':
             upload_log(args.session, args.quiet)
         elif args.action == 'onoff':
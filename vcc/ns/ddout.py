@@ -1,18 +1,68 @@
 from threading import Thread, Event
 from datetime import datetime, timedelta
 import re
+import os
+import json
+import time
 import logging
 from pathlib import Path
 
-from vcc import VCCError, json_decoder, vcc_cmd
+from vcc import VCCError, settings, json_decoder, vcc_cmd
 from vcc.ns import get_ddout_log
-from vcc.ns.onoff import post_onoff
+from vcc.ns.onoff import OnoffSpool
 from vcc.fslog import fs2time
 
 
 logger = logging.getLogger('vcc')
 
 
+# Position of DDoutScanner in active log. Saved on disk so that vccmon restarts at next unread byte
+class Checkpoint:
+
+    def __init__(self, path, interval=1.0):
+        self.path, self.interval = Path(path), interval
+        self.name, self.inode, self.offset = '', 0, 0
+        self.saved, self.modified = 0.0, False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.name, self.inode, self.offset = data['name'], data['inode'], data['offset']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    # Return saved offset if checkpoint is for this log and log has not been truncated
+    def resume(self, path, inode, size):
+        return self.offset if self.name == path.name and self.inode == inode and self.offset <= size else None
+
+    def update(self, path, inode, offset):
+        self.name, self.inode, self.offset = path.name, inode, offset
+        self.modified = True
+        self.flush()
+
+    # Save modified checkpoint if not saved during last interval
+    def flush(self):
+        if self.modified and time.monotonic() - self.saved >= self.interval:
+            self.save()
+
+    # Write to temporary file and rename so that checkpoint is never partially written
+    def save(self):
+        if not self.modified:
+            return
+        try:
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'name': self.name, 'inode': self.inode, 'offset': self.offset}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.saved, self.modified = time.monotonic(), False
+        except OSError as exc:
+            logger.warning(f'checkpoint not saved [{str(exc)}]')
+
+
 # Read records from log file opened by ddout
 class DDoutScanner(Thread):
     key_words: set = {'warm', 'missed', 'issue', 'fmout-gps', 'gps-fmout', 'late'}
@@ -33,19 +83,26 @@ class DDoutScanner(Thread):
                 ]
             ]
 
-    def __init__(self, sta_id, vcc):
+    def __init__(self, sta_id, vcc, spool=None, lognm='lognm', folder='/usr2/log', checkpoint='ddout.ckpt'):
         super().__init__()
 
         self.stopped = Event()
         self.sta_id, self.vcc = sta_id, vcc
+        self.lognm, self.folder = lognm, folder
         self.log = self.active = self.ses_id = None
-        self.log_time = {}
+        self.inode, self.offset, self.since = 0, 0, None
+        self.checkpoint = Checkpoint(Path(settings.Folders.log, 'vcc', checkpoint))
         self.onoff, self.header = [], []
-        self.onoff_not_sent = []
+        self.lines = self.events = 0
+        # Spool is shared when scanners of several stations run in same DDoutLoop
+        self.shared_spool = spool is not None
+        self.spool = spool if self.shared_spool else OnoffSpool(vcc)
+        self.spool.register(sta_id, vcc)
 
     # Close the log file
     def close_log(self):
         if self.log:
+            self.checkpoint.save()
             self.log.close()
             if self.ses_id:
                 self.send_msg({'status': f'{Path(self.active).name} closed', 'session': self.ses_id})
@@ -67,18 +124,19 @@ class DDoutScanner(Thread):
     def open_log(self, path):
         if not self.active or path.name != self.active.name:
             self.close_log()
-            self.active, self.log = path, open(path, 'r', encoding="utf8", errors="ignore")
-            try:
-                self.log.seek(0, 2)
-                self.log.seek(max(self.log.tell() - 10000, 0), 0)
-            except Exception as exc:
-                logger.debug(str(exc))
+            self.active, self.log = path, open(path, 'rb')
+            stat = os.fstat(self.log.fileno())
+            self.inode, self.since = stat.st_ino, None
+            # Resume at next unread byte or use last 10000 bytes of log that are not older than 2 seconds
+            if (offset := self.checkpoint.resume(path, self.inode, stat.st_size)) is None:
+                offset = max(stat.st_size - 10000, 0)
+                self.since = (datetime.utcnow() - timedelta(seconds=2)).timestamp()
+            self.offset = self.log.seek(offset, 0)
             self.ses_id = None
             if (name := path.stem).endswith(self.sta_id.lower()) and self.is_valid_session(ses_id := name[:-2]):
                 self.ses_id = ses_id
                 self.send_msg({'status': f'{path.name} opened', 'session': self.ses_id})
-            logger.debug(f'OPEN LOG {path.name} SES_ID {self.ses_id}')
-        return self.log_time.get(self.active.stem, (datetime.utcnow() - timedelta(seconds=2)).timestamp())
+            logger.debug(f'OPEN LOG {path.name} SES_ID {self.ses_id} OFFSET {self.offset}')
 
     # Check if ONOFF header
     def is_onoff_header(self, info):
@@ -96,14 +154,10 @@ class DDoutScanner(Thread):
         self.onoff.append(dict(**{'time': timestamp}, **record))
         return True
 
-    # Send ONOFF record to VCC
+    # Queue ONOFF records in spool. They are sent to VCC by spool thread
     def send_onoff(self):
-        try:
-            if self.onoff_not_sent:
-                self.onoff_not_sent = post_onoff(self.vcc, self.onoff_not_sent)
-            self.onoff = post_onoff(self.vcc, self.onoff)
-        except VCCError:
-            self.onoff_not_sent = self.onoff
+        if self.onoff:
+            self.spool.put(self.onoff, self.sta_id)
             self.onoff = []
 
     # Send station status to VCC Messenger
@@ -117,37 +171,102 @@ class DDoutScanner(Thread):
 
     def send_msg(self, status):
         logger.info(f"sending status {status}")
+        self.events += 1
         try:
             self.vcc.post(f'/messages/status', data={'session': self.ses_id, 'station': self.sta_id, 'status': status})
         except VCCError as exc:
             logger.warning(f"send_msg failed [{str(exc)}]")
 
+    # Process all completed lines written since last call
+    def scan_log(self):
+        for line in iter(self.log.readline, b''):
+            if not line.endswith(b'\n'):  # FS has not finished writing this line
+                self.log.seek(self.offset, 0)
+                break
+            self.offset += len(line)
+            self.lines += 1
+            if rec := self.is_pcfs(line.decode('utf-8', errors='ignore')):
+                timestamp = fs2time(rec['time'])
+                if self.since:
+                    if timestamp < self.since:
+                        continue
+                    self.since = None
+                info = rec['data']
+                if not self.is_onoff_header(info) and not self.is_onoff_record(timestamp, info):
+                    self.send_onoff()
+                    self.send_status(info)
+            self.checkpoint.update(self.active, self.inode, self.offset)
+
+    # Scan active log once. Checkpoint is flushed even if no new line was read.
+    def poll(self):
+        try:
+            if path := get_ddout_log(self.lognm, self.folder):
+                self.open_log(path)
+                self.scan_log()
+                self.checkpoint.flush()
+            else:
+                self.send_onoff()
+                self.close_log()
+        except VCCError as exc:
+            logger.warning(f'ddout {self.sta_id} communication failed - {str(exc)}')
+        except OSError as exc:  # Log or onoff spool could not be read or written
+            logger.warning(f'ddout {self.sta_id} file access failed - {str(exc)}')
+
+    def metrics(self):
+        return {'ddout_lines_scanned_total': self.lines, 'ddout_events_sent_total': self.events,
+                'ddout_log_open': int(self.log is not None)}
+
+    def finish(self):
+        self.send_onoff()
+        self.close_log()
+
     # The continuous function
     def run(self):
         logger.info(f'ddout started {self.native_id}')
+        if not self.shared_spool:
+            self.spool.start()
 
         while not self.stopped.wait(0.1):
-            try:
-                if path := get_ddout_log():
-                    last = self.open_log(path)
-                    for line in self.log:
-                        if rec := self.is_pcfs(line):
-                            if (timestamp := fs2time(rec['time'])) >= last:
-                                info = rec['data']
-                                if not self.is_onoff_header(info) and not self.is_onoff_record(timestamp, info):
-                                    self.send_onoff()
-                                    self.send_status(info)
-                                self.log_time[self.active.stem] = timestamp
-                else:
-                    self.send_onoff()
-                    self.close_log()
-            except VCCError as exc:
-                logger.warning(f'ddout communication failed - {str(exc)}')
+            self.poll()
 
-        self.send_onoff()
-        self.close_log()
+        self.finish()
+        if not self.shared_spool:
+            self.spool.stop()
+            self.spool.join()
         logger.info('ddout stopped')
 
     def stop(self):
         logger.debug(f'ddout stop requested')
         self.stopped.set()
+
+
+# Scan logs of several stations in one thread. ONOFF records of all stations go through the same spool.
+class DDoutLoop(Thread):
+
+    def __init__(self, spool):
+        super().__init__()
+
+        self.stopped = Event()
+        self.spool, self.scanners = spool, []
+
+    def add(self, sta_id, vcc, lognm='lognm', folder='/usr2/log', checkpoint=None):
+        checkpoint = checkpoint or f'ddout-{sta_id.lower()}.ckpt'
+        self.scanners.append(DDoutScanner(sta_id, vcc, self.spool, lognm, folder, checkpoint))
+
+    def run(self):
+        logger.info(f'ddout loop started {self.native_id} for {", ".join([s.sta_id for s in self.scanners])}')
+        self.spool.start()
+
+        while not self.stopped.wait(0.1):
+            for scanner in self.scanners:
+                scanner.poll()
+
+        for scanner in self.scanners:
+            scanner.finish()
+        self.spool.stop()
+        self.spool.join()
+        logger.info('ddout loop stopped')
+
+    def stop(self):
+        logger.debug(f'ddout loop stop requested')
+        self.stopped.set()
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import os
 import re
@@ -14,33 +16,215 @@ from vcc import settings, vcc_cmd
 logger = logging.getLogger('vcc')
 
 
+# Cache of drudg outputs (snp, prc and lst files). An entry is a folder named by the md5 of the schedule content,
+# the station, the drudg binary and skedf.ctl. Unchanged inputs are served by copying the cached files.
+class DrudgCache:
+
+    def __init__(self, size=20):
+        self.size = size  # Maximum number of entries
+        self.hits = self.misses = 0
+
+    @property
+    def folder(self):
+        return Path(settings.Folders.scratch, 'drudg')
+
+    @property
+    def enabled(self):
+        option = str(getattr(settings.DRUDG, 'cache', 'yes')).lower()
+        return option not in ('no', 'false', 'off', '0') and hasattr(settings.Folders, 'scratch')
+
+    @staticmethod
+    def md5(path):
+        md5 = hashlib.md5()
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(chunk)
+        except (OSError, TypeError):
+            return ''
+        return md5.hexdigest()
+
+    def key(self, schedule, sta_id):
+        executable = shutil.which(settings.DRUDG.exec.split()[0])
+        skedf = getattr(settings.DRUDG, 'skedf', '/usr2/control/skedf.ctl')
+        text = '-'.join([self.md5(schedule), sta_id, self.md5(executable), self.md5(skedf)])
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+    # Copy cached files to their folders with modified time of schedule. Return False if not in cache
+    def get(self, key, outputs, modified):
+        entry = Path(self.folder, key)
+        if not all(Path(entry, path.name).exists() for path in outputs):
+            self.misses += 1
+            return False
+        for path in outputs:
+            shutil.copyfile(Path(entry, path.name), path)
+            os.utime(path, (time.time(), modified))
+        os.utime(entry)  # Keep most recently used entries
+        self.hits += 1
+        return True
+
+    # Save outputs in cache and remove least recently used entries
+    def put(self, key, outputs):
+        if not all(path.exists() for path in outputs):
+            return
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            tmp, entry = Path(self.folder, f'{key}.tmp'), Path(self.folder, key)
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            for path in outputs:
+                shutil.copyfile(path, Path(tmp, path.name))
+            shutil.rmtree(entry, ignore_errors=True)
+            tmp.rename(entry)
+            entries = sorted([path for path in self.folder.iterdir() if path.is_dir()],
+                             key=lambda path: path.stat().st_mtime, reverse=True)
+            for path in entries[self.size:]:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError as exc:
+            logger.warning(f'drudg cache: {str(exc)}')
+
+    def metrics(self):
+        return {'drudg_cache_hits_total': self.hits, 'drudg_cache_misses_total': self.misses}
+
+
+cache = DrudgCache()
+
+
+# Timestamped record of a drudg session. Each event is [seconds since start, 'r' (received) or 's' (sent), text]
+class Transcript:
+
+    def __init__(self, ses_id, sta_id, command=''):
+        self.ses_id, self.sta_id, self.command = ses_id, sta_id, command
+        self.utc, self.start, self.events = datetime.utcnow(), time.monotonic(), []
+
+    def add(self, kind, text):
+        self.events.append([round(time.monotonic() - self.start, 4), kind, text])
+
+    def save(self, path):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump({'session': self.ses_id, 'station': self.sta_id, 'command': self.command,
+                           'utc': self.utc.strftime('%Y-%m-%d %H:%M:%S'), 'events': self.events}, f, indent=1)
+        except OSError as exc:
+            logger.warning(f'drudg transcript: {str(exc)}')
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return json.load(f)
+
+
+# Live drudg process. Output and replies are recorded in transcript
+class DrudgProcess:
+
+    def __init__(self, ses_id, sta_id, cmd, cwd):
+        self.transcript = Transcript(ses_id, sta_id, cmd)
+        self.child = pexpect.spawn(cmd, cwd=cwd, encoding='utf-8', codec_errors='ignore')
+
+    # Wait until drudg outputs something
+    def read(self, timeout):
+        try:
+            data = self.child.read_nonblocking(65536, timeout)
+        except pexpect.TIMEOUT:
+            raise TimeoutError
+        except pexpect.EOF:
+            raise EOFError
+        self.transcript.add('r', data)
+        return data
+
+    def send(self, line):
+        self.transcript.add('s', line)
+        self.child.sendline(line)
+
+    def close(self):
+        self.child.close()
+
+
+# Play recorded transcript in place of drudg. Output is returned without delay if speed is 0
+class ReplayProcess:
+
+    def __init__(self, path, speed=0):
+        self.path, self.speed = path, speed
+        record = Transcript.load(path)
+        self.events, self.index, self.clock = record['events'], 0, 0
+        self.transcript = Transcript(record['session'], record['station'], f'replay {path}')
+
+    def read(self, timeout):
+        if self.index >= len(self.events):
+            raise EOFError
+        elapsed, kind, text = self.events[self.index]
+        if kind == 's':  # Recorded drudg was waiting for a reply
+            raise TimeoutError
+        if self.speed:
+            time.sleep(max(elapsed - self.clock, 0) / self.speed)
+        self.clock, self.index = elapsed, self.index + 1
+        self.transcript.add('r', text)
+        return text
+
+    def send(self, line):
+        self.transcript.add('s', line)
+        for index in range(self.index, len(self.events)):
+            if self.events[index][1] == 's':
+                if self.events[index][2] != line:
+                    logger.debug(f'drudg replay: sent {line} instead of {self.events[index][2]}')
+                self.clock = self.events.pop(index)[0]
+                return
+        logger.warning(f'drudg replay: unexpected reply {line}')
+
+    def close(self):
+        pass
+
+
 # Manage interaction with drudg
 class DRUDG:
+    # Error message when prompts of required states are not received
+    errors = {'station': 'Did not get prompt for a station name', 'menu': 'Did not get a menu prompt',
+              'snap': 'Could not create SNAP file', 'proc': 'Could not create PROC file'}
+    is_output = [re.compile(r'From file:\s\S*\sTo\s\S*\s\S*\s(\S*)').search,
+                 re.compile(r'PROCEDURE LIBRARY FILE\s(\S*)').search]
 
-    def __init__(self, ses_id, sta_id):
+    def __init__(self, ses_id, sta_id, replay=None, speed=0):
         self.ses_id, self.sta_id = ses_id.lower(), sta_id.lower()
-        # Default timeout time (sec)
+        # Maximum time without output from drudg (sec)
         self.timeout = 3
         self.modified = time.time()
+        self.cached, self.moved = False, set()  # Output files moved by drudg session
+        self.replay, self.speed = replay, speed
+        self.transcript, self.buffer, self.searched = None, '', 0
         logger.info('drug initialized')
 
-    # Look for specific pattern and provide selection
-    def pattern_response(self, child, pattern, selection, end_on_error=True):
-        try:
-            if child.expect([pattern], timeout=self.timeout) == 0:
-                logger.debug(f'pattern {pattern.encode()} {selection} - ok')
-                if selection:
-                    child.sendline(selection)
-                return True
-        except (pexpect.EOF, pexpect.TIMEOUT):
-            pass
-        logger.error(f'pattern {pattern.encode()} {selection} - not found')
-        if end_on_error:
-            child.close()
-        return False
+    @property
+    def transcript_path(self):
+        return Path(settings.Folders.log, 'vcc', f'{self.ses_id}{self.sta_id}.drudg')
 
-    # start interactive drudg
-    def drudg(self, filename):
+    # Expected prompts for each state as (pattern, reply, next state).
+    # Depending on how skedf.ctl is set up, drudg may ask purge questions while making SNAP and PRC files.
+    def states(self):
+        lst = os.path.join(settings.Folders.list, f'{self.ses_id}{self.sta_id}.lst')
+        menu, option = re.compile(r'\r\n \?'), re.compile(r'no change[^\n]*\n')
+        purge = re.compile(r'purge existing')
+        return {'station': [(re.compile(r'which station .*all\) \? '), self.sta_id.capitalize(), 'menu')],
+                'menu': [(menu, '3', 'snap')],
+                'snap': [(purge, 'y', 'snap'), (menu, '12', 'proc')],
+                'proc': [(purge, 'y', 'proc'), (menu, '9', 'list')],
+                'list': [(re.compile(r'else enter in filename or PRINT.\r\n'), lst, 'option1')],
+                'option1': [(option, '', 'option2')],
+                'option2': [(option, '', 'option3')],
+                'option3': [(option, '', 'exit')],
+                'exit': [(re.compile(r' \?'), '5', 'quit')],
+                'quit': [(re.compile(r' \?'), '0', 'done')],
+                'done': [(re.compile(r'DRUDG DONE'), None, None)]
+                }
+
+    # Output files of drudg
+    def outputs(self):
+        name = f'{self.ses_id}{self.sta_id}'
+        return [Path(settings.Folders.snap, f'{name}.snp'), Path(settings.Folders.proc, f'{name}.prc'),
+                Path(settings.Folders.list, f'{name}.lst')]
+
+    # Copy outputs from cache or start interactive drudg
+    def drudg(self, filename, use_cache=True):
 
         logger.info(f'processing {filename}')
 
@@ -48,84 +232,104 @@ class DRUDG:
         logger.debug(f'DRUDG {schedule}')
         self.modified = os.stat(schedule).st_mtime
 
+        if not (use_cache and cache.enabled):
+            return self.run_drudg(schedule)
+        key = cache.key(schedule, self.sta_id)
+        self.cached = cache.get(key, self.outputs(), self.modified)
+        if self.cached:
+            logger.info(f'drudg outputs for {filename} copied from cache')
+            return None
+        started = int(time.time())  # Whole seconds for file systems with coarse timestamps
+        if not (err := self.run_drudg(schedule)):
+            if all(self.is_new(path, started) for path in self.outputs()):
+                cache.put(key, self.outputs())
+            else:
+                logger.debug('drudg cache: outputs not updated by drudg')
+        return err
+
+    # Check that output was made by last drudg session. The snp and prc files moved by drudg have the modified
+    # time of the schedule, other outputs must have been modified after drudg started.
+    def is_new(self, path, started):
+        try:
+            return path in self.moved or path.stat().st_mtime >= started
+        except OSError:
+            return False
+
+    # Interactive drudg session (or replay of a transcript). Transcript of live session is saved for diagnosis.
+    def run_drudg(self, schedule):
         cmd = f'{settings.DRUDG.exec} {schedule}'
         logger.debug(f'DRUDG {cmd}')
 
         # Run drudg with the working directory set to Folders.schedules
         try:
-            child = pexpect.spawn(cmd, cwd=settings.Folders.schedule)
+            child = ReplayProcess(self.replay, self.speed) if self.replay \
+                else DrudgProcess(self.ses_id, self.sta_id, cmd, settings.Folders.schedule)
         except (pexpect.ExceptionPexpect, BaseException) as exc:
             return f'Problem starting drudg: {str(exc)}'
+        try:
+            return self.interact(child)
+        finally:
+            child.close()
+            self.transcript = child.transcript
+            if not self.replay:
+                self.transcript.save(self.transcript_path)
 
-        # Select station
-        if not self.pattern_response(child, "which station .*all\) \? ", self.sta_id.capitalize()):
-            return "Did not get prompt for a station name"
-        # Expected pattern is a ? prompt and select SNP (3) option
-        if not self.pattern_response(child, "\r\n \?", '3'):
-            return "Did not get a menu prompt"
-        # Make SNAP File
-        if not self.expect_drudg_prompts(child, "12", settings.Folders.snap):
-            return "Could not create SNAP file"
-        # Make PRC File. Depending on how skedf.ctl is set up, the user may be prompted for extra data
-        if not self.expect_drudg_prompts(child, "9", settings.Folders.proc):
-            return 'Could not create PROC file'
-        # Change output dest
-        lst = os.path.join(settings.Folders.list, f'{self.ses_id}{self.sta_id}.lst')
-        self.pattern_response(child, "else enter in filename or PRINT.\r\n", lst, end_on_error=False)
-        for i in range(3):
-            [child.expect(expected) for expected in ["no change", "\r\n"]]
-            child.sendline("")
-        self.pattern_response(child, " \?", "5", end_on_error=False)
-        self.pattern_response(child, " \?", "0", end_on_error=False)
-        self.pattern_response(child, "DRUDG DONE", None, end_on_error=False)
-        child.close()
-
+    # Go through states until done. Only failures in states with error message are reported.
+    def interact(self, child):
+        states, state = self.states(), 'station'
+        self.buffer, self.searched, self.moved = '', 0, set()
+        while state:
+            transitions = states[state]
+            index, before = self.expect(child, [pattern for pattern, *_ in transitions])
+            if index is None:
+                logger.error(f'drudg {state}: no prompt after {repr(before[-80:])}')
+                return self.errors.get(state)
+            pattern, reply, next_state = transitions[index]
+            logger.debug(f'drudg {state}: {pattern.pattern.encode()} {reply}')
+            if folder := {'snap': settings.Folders.snap, 'proc': settings.Folders.proc}.get(state):
+                self.move_output(before, folder)
+            if reply is not None:
+                child.send(reply)
+            state = next_state
         return None
 
-    def expect_drudg_prompts(self, child, next_selection, folder):
-        # Array of possible prompts and corresponding reply
-        # misc = settings.DRUDG.Misc
-        prompts = ["\r\n \?", "purge existing"]
-        #, "Enter TPI period in centiseconds", "Enter in cont_cal action",)
-        # "Enter in cont_cal_polarity", "Enter in vsi_align", "Use setup_proc", "vdif_single_thread_per_file"]
-        replies = ['', 'y']
-        # , misc.tpi_period, misc.cont_cal_action, misc.cont_cal_polarity, misc.vsi_align,misc.setup_proc, misc.vdif_single_thread_per_file]
-        done = False
-        while not done:
+    # Wait for earliest match of patterns. Only the unsearched part of output is searched when new output arrives.
+    # Return index of pattern and text before it, or None if drudg ended or was silent for timeout seconds.
+    def expect(self, child, patterns):
+        while True:
+            found = [(match.start(), index, match) for index, pattern in enumerate(patterns)
+                     if (match := pattern.search(self.buffer, self.searched))]
+            if found:
+                _, index, match = min(found, key=lambda item: item[:2])
+                before, self.buffer, self.searched = self.buffer[:match.start()], self.buffer[match.end():], 0
+                return index, before
+            # Prompts do not span lines. Next search starts with last line.
+            self.searched = max(self.buffer.rfind('\n') - 1, 0)
             try:
-                index = child.expect(prompts, timeout=self.timeout)  # Get prompt index
-            except (pexpect.EOF, pexpect.TIMEOUT):
-                return False
-            # and deal with the output...
-            if index == 0:
-                logger.debug('prompts: done')
-                done = True  # back to main drudg prompt
-            else:
-                logger.debug(f"prompts: {prompts[index]}: {str(replies[index])}")
-                child.sendline(str(replies[index]))
-
-            # look for information from drudg on where the snp or prc files were placed (if they were created):
-            match = re.search("From file:\s\S*\sTo\s\S*\s\S*\s(\S*)", child.before.decode('utf-8'))
-            if not match:
-                match = re.search("PROCEDURE LIBRARY FILE\s(\S*)", child.before.decode('utf-8'))
-            if match:
-                logger.debug(f'prompts: match {match.group(1)}')
-                outfile = match.group(1).strip()
-                logger.debug(f'outfile 1 {outfile}')
-                outfile = outfile if os.path.dirname(outfile) else os.path.join(settings.Folders.schedule, outfile)
-                logger.debug(f'outfile 2 {outfile}')
-                # Set modified time to same than schedule file
-                os.utime(outfile, (time.time(), self.modified))
-                # Move to appropriate folder
-                if folder != os.path.dirname(outfile):
-                    shutil.move(outfile, os.path.join(folder, os.path.basename(outfile)))
-
-        # Provide next selection
-        child.sendline(next_selection)
-        return True
+                self.buffer += child.read(self.timeout)
+            except (TimeoutError, EOFError):
+                return None, self.buffer
+
+    # Look for information from drudg on where the snp or prc files were placed (if they were created)
+    def move_output(self, text, folder):
+        if not (match := self.is_output[0](text) or self.is_output[1](text)):
+            return
+        outfile = match.group(1).strip()
+        logger.debug(f'outfile 1 {outfile}')
+        outfile = outfile if os.path.dirname(outfile) else os.path.join(settings.Folders.schedule, outfile)
+        logger.debug(f'outfile 2 {outfile}')
+        if not os.path.exists(outfile):
+            logger.debug(f'{outfile} not found')
+            return
+        # Set modified time to same than schedule file
+        os.utime(outfile, (time.time(), self.modified))
+        # Move to appropriate folder
+        if folder != os.path.dirname(outfile):
+            outfile = shutil.move(outfile, os.path.join(folder, os.path.basename(outfile)))
+        self.moved.add(Path(outfile))
 
 
-def drudg_it(ses_id, vex=False):
+def drudg_it(ses_id, vex=False, use_cache=True):
     def file_time(f):
         return f'{datetime.fromtimestamp(f.lstat().st_mtime).strftime("%Y-%m-%d %H:%M")}'
 
@@ -138,10 +342,10 @@ def drudg_it(ses_id, vex=False):
 
     drudg = DRUDG(ses_id, sta_id)
     filename = f'{ses_id}.{"vex" if vex else "skd"}'
-    if err := drudg.drudg(filename):
+    if err := drudg.drudg(filename, use_cache):
         print(f'drudg failed!: {err}')
     else:
-        print('drudg successful!')
+        print(f'drudg successful!{" (outputs copied from cache)" if drudg.cached else ""}')
         filepath = Path(settings.Folders.schedule, filename)
         print(f'{str(filepath):30s} {file_time(filepath)}')
         for file in [Path(settings.Folders.snap, f'{ses_id}{sta_id}.snp'),
@@ -149,3 +353,46 @@ def drudg_it(ses_id, vex=False):
                      Path(settings.Folders.list, f'{ses_id}{sta_id}.lst')]:
             print(f'{str(file):30s} {file_time(file) if file.exists() else "not found"}')
 
+
+
+# Replay recorded transcript to test and benchmark drudg automation without drudg binary
+def main():
+    import argparse
+    import tempfile
+    from vcc import make_object
+
+    parser = argparse.ArgumentParser(description='Replay drudg transcript', prog='drudg')
+    parser.add_argument('-s', '--speed', help='replay speed (0 for no delay)', type=float, default=0)
+    parser.add_argument('-n', '--repeat', help='number of replays', type=int, default=1)
+    parser.add_argument('path', help='transcript of drudg session')
+
+    args = parser.parse_args()
+    try:
+        record = Transcript.load(args.path)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f'invalid transcript {args.path} - {str(exc)}')
+        return 1
+    folder = tempfile.mkdtemp(prefix='vcc-drudg-')
+    make_object({'Folders': {name: folder for name in ('schedule', 'snap', 'proc', 'list', 'log')},
+                 'DRUDG': {'exec': 'drudg'}}, settings)
+    # Folders are not the same than recorded session
+    expected = [os.path.basename(text) for _, kind, text in record['events'] if kind == 's']
+    elapsed, err, drudg = [], None, None
+    for _ in range(args.repeat):
+        drudg = DRUDG(record['session'], record['station'], replay=args.path, speed=args.speed)
+        start = time.perf_counter()
+        err = drudg.run_drudg(Path(folder, f'{record["session"]}.skd'))
+        elapsed.append(time.perf_counter() - start)
+    sent = [os.path.basename(text) for _, kind, text in drudg.transcript.events if kind == 's']
+    elapsed.sort()
+    print(f'{args.path}: {err if err else "ok"}')
+    print(f'{len(sent)} replies sent {"as recorded" if sent == expected else f"(recorded {len(expected)})"}')
+    print(f'{args.repeat} replays min {1000 * elapsed[0]:.3f} ms median {1000 * elapsed[len(elapsed) // 2]:.3f} ms'
+          f' (recorded session {record["events"][-1][0] if record["events"] else 0:.3f} s)')
+    return 1 if err else 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    sys.exit(main())
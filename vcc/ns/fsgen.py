@@ -0,0 +1,150 @@
+import sys
+import random
+from datetime import datetime, timedelta
+from itertools import product
+from string import ascii_lowercase
+from pathlib import Path
+
+"""
+Generate synthetic FS logs for benchmarks of fs2time, onoff, SHORTlog.reduce_it and DDoutScanner.
+Logs have scans with scan_name= and source= lines, #trakl# acquisitions, #rdtc/#dbtcn multicast noise,
+halts and continues and #onoff# blocks. The same seed always gives the same logs.
+"""
+
+STATIONS = ['gs', 'wf', 'k2', 'mg', 'ny', 'wz', 'ys', 'hb', 'ke', 'yg', 'ht', 'ns', 'sa', 'is', 'ag', 'ow', 'oe',
+            'on', 'mc', 'nt', 'ma', 'kk', 'ws', 'sh']
+SOURCES = ['0059+581', '0552+398', '1334-127', '1739+522', '2229+695', '0727-115', '1803+784', '4C39.25',
+           '0016+731', '0454-234', '1357+769', '1849+670', '2255-282', '0133+476', '1124-186', '3C418']
+CALIBRATORS = ['casa', 'cyga', 'taua', 'oria', '3c84', 'virgoa']
+DETECTORS = [('ia', 'l'), ('ib', 'l'), ('ic', 'r'), ('id', 'r'), ('1l', 'l'), ('1u', 'l'), ('9l', 'r'), ('9u', 'r')]
+
+
+# Station codes. Codes not used by IVS stations are added when more stations are needed
+def station_codes(nbr):
+    extra = [a + b for a, b in product(ascii_lowercase, repeat=2) if a + b not in STATIONS]
+    return (STATIONS + extra)[:nbr]
+
+
+# Format time in FS format (yyyy.ddd.hh:mm:ss.ss) from integer centiseconds since start.
+# Day of year and year roll over like real logs.
+def fs_time(start, centi):
+    utc = start + timedelta(milliseconds=centi * 10)
+    return f'{utc:%Y.%j.%H:%M:%S}.{utc.microsecond // 10000:02d}'
+
+
+class FSLogGenerator:
+    def __init__(self, ses_id, sta_id, start, duration, seed=0, noise=1.0, onoff_period=3600, halts=1):
+        self.ses_id, self.sta_id = ses_id.lower(), sta_id.lower()
+        self.start, self.duration = start, int(duration)
+        self.noise, self.onoff_period, self.halts = noise, onoff_period, halts
+        self.random = random.Random(f'{seed}-{self.sta_id}')
+        self.last = 0  # Time of last line so that times never go backward
+
+    @property
+    def name(self):
+        return f'{self.ses_id}{self.sta_id}.log'
+
+    def line(self, centi, text):
+        self.last = max(centi, self.last)
+        return f'{fs_time(self.start, self.last)}{text}\n'
+
+    # Multicast records between first and last (centiseconds). Noise is the number of records per second,
+    # so several records can have the same time when it is more than 100.
+    def multicast(self, first, last):
+        lines, nbr = [], int((last - first) * self.noise / 100) if self.noise > 0 and last > first else 0
+        for index in range(nbr):
+            centi = first + index * (last - first) // nbr
+            rnd = self.random.random
+            if rnd() < 0.5:
+                lines.append(self.line(centi, f'#rdtc#rdtca/tsys,{rnd() * 100:.1f},{rnd() * 100:.1f},'
+                                              f'{rnd() * 100:.1f},{rnd() * 100:.1f},{rnd() * 100:.1f}'))
+            else:
+                lines.append(self.line(centi, f'#dbtcn#dbbc/tpi,{int(rnd() * 30000)},{int(rnd() * 30000)},'
+                                              f'{int(rnd() * 30000)},{int(rnd() * 30000)}'))
+        return lines
+
+    def onoff(self, centi):
+        source = self.random.choice(CALIBRATORS)
+        az, el = self.random.uniform(0, 360), self.random.uniform(15, 85)
+        lines = [self.line(centi, '#onoff#    source       Az   El  De   I P   Center   TCal    Flux    DPFU    '
+                                  ' Gain    Product   LO    T   SEFD  Tsys  Tcal(j)  Tcal(r)')]
+        for device, pol in DETECTORS:
+            centi += 7
+            tsys, sefd = self.random.uniform(40, 120), self.random.uniform(500, 3000)
+            center, flux, lo = [self.random.uniform(*limits) for limits in [(2000, 9000), (20, 900), (1000, 8000)]]
+            lines.append(self.line(centi, f'#onoff#VAL {source:10s} {az:5.1f} {el:4.1f} {device} 1 {pol} '
+                                          f'{center:8.2f} 1.4700 {flux:7.2f} 0.0950 0.9920 0.094241 {lo:8.2f} u '
+                                          f'{sefd:6.1f} {tsys:5.1f} 1.470 1.000'))
+        return lines
+
+    # Generate lines of log in chronological order. Each item is a list of lines for one scan.
+    def scans(self):
+        centi, end = 0, self.duration * 100
+        yield [self.line(centi, f';log={self.ses_id}{self.sta_id}'),
+               self.line(centi + 1, ':exper_initi'),
+               self.line(centi + 2, f'/location/{self.sta_id},0.0,0.0,0.0')]
+        centi += 3
+        halt_prob = self.halts * 180 / max(self.duration, 1)
+        next_onoff = centi + self.onoff_period * 100
+        while centi < end:
+            source = self.random.choice(SOURCES)
+            slew, length = self.random.randint(10, 60) * 100, self.random.randint(30, 300) * 100
+            name = fs_time(self.start, centi)[5:14].replace(':', '').replace('.', '-')
+            lines = [self.line(centi, f':scan_name={name},{self.ses_id},{self.sta_id},{length // 100},{length // 100}'),
+                     self.line(centi + 1, f':source={source},{self.random.randint(0, 235959):06d}.00,'
+                                          f'{self.random.randint(-895959, 895959):+07d}.0,2000.0,neutral')]
+            lines.extend(self.multicast(centi + 50, centi + slew))
+            lines.append(self.line(centi + slew, '#trakl# Source acquired'))
+            lines.append(self.line(centi + slew + 1, ':data_valid=on'))
+            lines.extend(self.multicast(centi + slew + 50, centi + slew + length))
+            centi += slew + length
+            lines.append(self.line(centi, ':data_valid=off'))
+            if self.random.random() < halt_prob:
+                pause = self.random.randint(60, 900) * 100
+                lines.append(self.line(centi + 1, ';halt'))
+                lines.extend(self.multicast(centi + 100, centi + pause))
+                lines.append(self.line(centi + pause, ';cont'))
+                centi += pause
+            if centi >= next_onoff:
+                lines.extend(self.onoff(centi + 10))
+                next_onoff, centi = centi + self.onoff_period * 100, centi + 200
+            centi += 1
+            yield lines
+        yield [self.line(centi, ':sched_end')]
+
+    def write(self, folder):
+        path = Path(folder, self.name)
+        with open(path, 'w', buffering=1024 * 1024) as f:
+            for lines in self.scans():
+                f.writelines(lines)
+        return path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate synthetic FS logs', prog='fsgen')
+    parser.add_argument('-o', '--output', help='output folder', default='.')
+    parser.add_argument('-d', '--duration', help='duration of session in hours', type=float, default=24)
+    parser.add_argument('-n', '--stations', help='number of stations', type=int, default=1)
+    parser.add_argument('-S', '--start', help='start time (yyyy-mm-dd hh:mm)', default='2024-04-10 17:30')
+    parser.add_argument('-r', '--rate', help='multicast noise lines per second', type=float, default=1.0)
+    parser.add_argument('-p', '--onoff', help='onoff period in seconds', type=int, default=3600)
+    parser.add_argument('-H', '--halts', help='average number of halts per session', type=float, default=1)
+    parser.add_argument('-s', '--seed', help='random seed', type=int, default=0)
+    parser.add_argument('session', help='session code', nargs='?', default='r4999')
+
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d %H:%M')
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    for sta_id in station_codes(args.stations):
+        gen = FSLogGenerator(args.session, sta_id, start, args.duration * 3600, seed=args.seed, noise=args.rate,
+                             onoff_period=args.onoff, halts=args.halts)
+        path = gen.write(args.output)
+        print(f'{path} {path.stat().st_size / 1000000:.1f} MB')
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
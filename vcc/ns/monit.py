@@ -5,7 +5,9 @@ import logging
 import time
 
 from collections import namedtuple
-from threading import Thread, Event
+from itertools import count
+from queue import PriorityQueue
+from threading import Thread, Event, Lock
 
 from vcc.client import VCC, VCCError
 from vcc.ns.processes import ProcessMsg, ProcessSchedule, ProcessLog
@@ -17,15 +19,91 @@ logger = logging.getLogger('vcc')
 process = dict(schedule=ProcessSchedule, log=ProcessLog)
 
 
+# Fixed number of workers processing messages by priority. Urgent messages go first and schedules last.
+# Only the latest schedule message for a session is processed and never at the same time than another one.
+class MessagePool:
+    priorities = dict(urgent=0, log=2, schedule=3)
+
+    def __init__(self, workers=3):
+        self.queue, self.lock, self.seq = PriorityQueue(), Lock(), count()
+        self.latest, self.running, self.deferred = {}, set(), {}
+        self.processed = self.superseded = 0
+        self.workers = [Thread(target=self.work, name=f'worker-{index}') for index in range(workers)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def put(self, code, task, key=None):
+        with self.lock:
+            seq = next(self.seq)
+            if key:
+                self.latest[key] = seq
+        self.queue.put((self.priorities.get(code, 1), seq, key, task))
+
+    # Return next task to execute or None if it has been superseded or deferred
+    def select(self, item):
+        _, seq, key, task = item
+        with self.lock:
+            if key:
+                if self.latest.get(key) != seq:
+                    self.superseded += 1
+                    return None
+                if key in self.running:
+                    self.deferred[key] = item
+                    return None
+                self.running.add(key)
+        return task
+
+    def done(self, key):
+        with self.lock:
+            self.processed += 1
+            if key:
+                self.running.discard(key)
+                if item := self.deferred.pop(key, None):
+                    self.queue.put(item)
+
+    def work(self):
+        while (item := self.queue.get())[-1]:
+            if task := self.select(item):
+                try:
+                    task.run()
+                except Exception as exc:
+                    logger.warning(f'{task.__class__.__name__} failed - 0 {str(exc)}')
+                    for index, line in enumerate(traceback.format_exc().splitlines(), 1):
+                        logger.warning(f'{task.__class__.__name__} failed - {index:2d} {line.strip()}')
+                finally:
+                    self.done(item[2])
+
+    def metrics(self):
+        with self.lock:
+            return {'inbox_queue_depth': self.queue.qsize(), 'inbox_running': len(self.running),
+                    'inbox_deferred': len(self.deferred), 'inbox_processed_total': self.processed,
+                    'inbox_superseded_total': self.superseded}
+
+    # Workers stop after processing remaining messages. Stop requests sort after all messages.
+    # Workers are not daemon threads, so a message still running after timeout is completed before exit.
+    def stop(self, timeout=5):
+        if waiting := self.queue.qsize():
+            logger.info(f'processing {waiting} remaining messages before stopping')
+        for _ in self.workers:
+            self.queue.put((float('inf'), next(self.seq), None, None))
+        for worker in self.workers:
+            worker.join(timeout)
+        if busy := [worker.name for worker in self.workers if worker.is_alive()]:
+            logger.warning(f'{" ".join(busy)} still processing messages after {timeout} seconds')
+
+
 class InboxMonitor(Thread):
 
     extract_name = re.compile('.*filename=\"(?P<name>.*)\".*').match
 
-    def __init__(self, sta_id, vcc, interval=5):
+    def __init__(self, sta_id, vcc, interval=5, workers=3):
         super().__init__()
 
         self.sta_id, self.vcc, self.interval = sta_id, vcc, interval
         self.stopped = Event()
+        self.pool = MessagePool(workers)
 
     def check_inbox(self):
         t = time.time()
@@ -39,9 +117,11 @@ class InboxMonitor(Thread):
 
     def run(self):
         logger.info(f'monit started {self.native_id}')
+        self.pool.start()
         dt = self.check_inbox()
         while not self.stopped.wait(self.interval if dt > self.interval else self.interval - dt):
             dt = self.check_inbox()
+        self.pool.stop()
 
     def stop(self):
         logger.info(f'inbox stop requested')
@@ -50,7 +130,7 @@ class InboxMonitor(Thread):
     def process_message(self, headers, data):
         code = headers['code']
         logger.info(f'process_message{headers} {data}')
-        if code == 'ping':
+        if code == 'ping':  # Answered immediately by this thread
             logger.info('receive pong')
             self.pong(headers['sender'], status='Ok')
         else:  # Decode message
@@ -58,8 +138,8 @@ class InboxMonitor(Thread):
                 data = json.loads(data) if headers.get('format', 'text') == 'json' else {}
                 text = ', '.join([f'{key}={val}' for key, val in data.items()]) if isinstance(data, dict) else str(data)
                 logger.info(f'processing message: {code} {text}')
-                if prc := process.get(code, ProcessMsg):
-                    prc(self.vcc, self.sta_id, headers, data).start()
+                key = (code, data.get('session')) if code == 'schedule' and isinstance(data, dict) else None
+                self.pool.put(code, process.get(code, ProcessMsg)(self.vcc, self.sta_id, headers, data), key)
             except Exception as exc:
                 logger.warning(f'message invalid -  0 {str(exc)}')
                 for index, line in enumerate(traceback.format_exc().splitlines(), 1):
@@ -1,6 +1,11 @@
 import re
+import os
+import json
+import time
 import logging
+from collections import deque
 from pathlib import Path
+from threading import Thread, Event, Lock
 
 from vcc import VCCError, settings
 from vcc.client import VCC
@@ -10,19 +15,184 @@ from vcc.fslog import fs2time
 logger = logging.getLogger('vcc')
 
 
-# Send ONOFF records to VCC
+# Send ONOFF records to VCC. Return records that could not be sent
 def post_onoff(vcc, records):
     if records:
         try:
             if vcc and (rsp := vcc.post('/data/onoff', data=records)):
                 logger.info(f'uploaded {len(records)} onoff records for {records[0]["source"]}')
             else:
-                raise VCCError(rsp.text)
+                raise VCCError(rsp.text if vcc else 'no connection')
         except VCCError as exc:
             logger.warning(f'failed uploading onoff {str(exc)}')
+            return records
     return []
 
 
+# Append-only spool of ONOFF batches waiting to be sent to VCC. A background thread drains it.
+# Sent batches are not removed from the file. The offset of the first batch not sent is kept in a small marker
+# file and the spool is truncated when everything has been sent. Batches rejected by VCC are moved to a
+# dead-letter file so that they never block the following ones.
+class OnoffSpool(Thread):
+
+    def __init__(self, vcc, path=None, interval=10, max_delay=600, bulk=1000):
+        super().__init__()
+
+        self.vcc, self.interval, self.max_delay, self.bulk = vcc, interval, max_delay, bulk
+        self.path = Path(path) if path else Path(settings.Folders.log, 'vcc', 'onoff.spool')
+        self.marker, self.rejected_path = self.path.with_suffix('.offset'), self.path.with_suffix('.rejected')
+        self.stopped, self.wakeup, self.lock = Event(), Event(), Lock()
+        self.pending, self.ends = deque(), deque()  # Batches and offset of their end in spool
+        self.failures, self.sent, self.rejected = 0, 0, 0
+        self.clients = {}  # Connections used to send records of other stations
+        self.load()
+
+    # Read batches left in spool by previous vccmon. Batches before offset in marker were already sent.
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            offset = int(self.marker.read_text() or 0)
+        except (OSError, ValueError):
+            offset = 0
+        offset = offset if offset <= self.path.stat().st_size else 0  # Spool truncated before marker was updated
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line_nbr, line in enumerate(f, 1):
+                offset += len(line)
+                try:
+                    if line.strip():
+                        self.pending.append(json.loads(line))
+                        self.ends.append(offset)
+                except ValueError:
+                    logger.warning(f'{self.path.name} line {line_nbr} is corrupted')
+        if self.pending:
+            logger.info(f'{len(self.pending)} onoff batches in {self.path.name}')
+
+    @staticmethod
+    def encode(batch):
+        return (json.dumps(batch) + '\n').encode('utf-8')
+
+    # Records of station are sent using its own identity
+    def register(self, sta_id, vcc):
+        self.clients[sta_id] = vcc
+
+    # Add records to spool. Only local disk access so that scanning is never blocked by VCC
+    def put(self, records, sta_id=None):
+        if not records:
+            return
+        batch = {'queued': time.time(), 'records': records}
+        if sta_id:
+            batch['station'] = sta_id
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(self.encode(batch))
+                f.flush()
+                os.fsync(f.fileno())
+                self.ends.append(f.tell())
+            self.pending.append(batch)
+        self.wakeup.set()
+
+    # Remove sent batches. Only the marker is updated, or the spool truncated when nothing is left.
+    def remove(self, nbr):
+        with self.lock:
+            for _ in range(nbr):
+                self.pending.popleft()
+                offset = self.ends.popleft()
+            if not self.pending:
+                open(self.path, 'wb').close()
+                offset = 0
+        tmp = self.marker.with_suffix('.tmp')
+        tmp.write_text(str(offset))
+        os.replace(tmp, self.marker)
+
+    # Keep batches rejected by VCC in dead-letter file
+    def reject(self, batches, reason):
+        with open(self.rejected_path, 'ab') as f:
+            for batch in batches:
+                f.write(self.encode(dict(**batch, reason=reason)))
+        self.rejected += len(batches)
+        logger.warning(f'{sum(len(batch["records"]) for batch in batches)} onoff records rejected by VCC '
+                       f'[{reason}] moved to {self.rejected_path.name}')
+
+    # Send records to VCC. Return 'sent', 'failed' when VCC could not be reached or 'rejected' with reason
+    @staticmethod
+    def send(vcc, records):
+        try:
+            if not vcc:
+                raise VCCError('no connection')
+            rsp = vcc.post('/data/onoff', data=records)
+        except VCCError as exc:
+            logger.warning(f'failed uploading onoff {str(exc)}')
+            return 'failed', str(exc)
+        if rsp:
+            logger.info(f'uploaded {len(records)} onoff records for {records[0]["source"]}')
+            return 'sent', ''
+        # Request errors other than timeout or too many requests will not succeed if tried again
+        if 400 <= rsp.status_code < 500 and rsp.status_code not in (408, 429):
+            return 'rejected', f'{rsp.status_code} {rsp.text}'
+        logger.warning(f'failed uploading onoff {rsp.status_code} {rsp.text}')
+        return 'failed', rsp.text
+
+    # Send pending batches of same station in bulk. Return False if VCC could not be reached
+    def drain(self):
+        while self.pending:
+            with self.lock:
+                batches, records, sta_id = [], [], self.pending[0].get('station')
+                for batch in self.pending:
+                    if batch.get('station') != sta_id or \
+                            (records and len(records) + len(batch['records']) > self.bulk):
+                        break
+                    batches.append(batch)
+                    records.extend(batch['records'])
+            status, reason = self.send(vcc := self.clients.get(sta_id, self.vcc), records)
+            # Find rejected batch by sending first batch alone
+            if status == 'rejected' and len(batches) > 1:
+                batches, records = batches[:1], batches[0]['records']
+                status, reason = self.send(vcc, records)
+            if status == 'failed':
+                self.failures += 1
+                return False
+            if status == 'rejected':
+                self.reject(batches, reason)
+            else:
+                self.sent += len(records)
+            self.remove(len(batches))
+            self.failures = 0
+        return True
+
+    @property
+    def size(self):
+        return sum(len(batch['records']) for batch in list(self.pending))
+
+    @property
+    def age(self):
+        return time.time() - batch['queued'] if (batch := next(iter(self.pending), None)) else 0
+
+    def metrics(self):
+        return {'onoff_spool_batches': len(self.pending), 'onoff_spool_records': self.size,
+                'onoff_spool_age_seconds': round(self.age, 1), 'onoff_sent_records_total': self.sent,
+                'onoff_consecutive_failures': self.failures, 'onoff_rejected_batches_total': self.rejected}
+
+    def run(self):
+        logger.info(f'onoff spool started {self.native_id}')
+        while not self.stopped.is_set():
+            try:
+                self.drain()
+            except Exception as exc:
+                logger.warning(f'onoff spool {str(exc)}')
+                self.failures += 1
+            # Retry with exponential backoff when VCC is not available
+            delay = min(self.interval * 2 ** self.failures, self.max_delay) if self.failures else self.interval
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+        logger.info('onoff spool stopped')
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+
 def onoff(filepath):
     is_header = re.compile(r'^(?P<time>^\d{4}\.\d{3}\.\d{2}:\d{2}:\d{2}\.\d{2})(?P<key>#onoff#    source)'
                            r'(?P<data>.*)$').match
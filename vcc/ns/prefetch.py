@@ -0,0 +1,85 @@
+import logging
+import random
+import traceback
+from datetime import datetime, timedelta
+from threading import Thread, Event
+
+from vcc import settings, json_decoder
+from vcc.client import VCCError
+from vcc.ns import notify
+from vcc.ns.processes import PrefetchSchedule
+
+logger = logging.getLogger('vcc')
+
+
+# Make sure schedules of upcoming sessions are downloaded and drudged before they start.
+# Sessions are checked one at a time with some spacing. While the station is observing, only sessions
+# starting within lead time are checked so that the prefetch does not compete with the current session.
+class Prefetcher(Thread):
+
+    def __init__(self, sta_id, vcc, interval=1800, days=3, lead=6, spacing=30):
+        super().__init__()
+
+        self.sta_id, self.vcc = sta_id, vcc
+        self.interval, self.days, self.spacing = interval, days, spacing
+        self.lead = timedelta(hours=lead)
+        self.stopped = Event()
+        self.warned = {}  # Last problem reported for session
+        self.checked = self.updated = self.failures = 0
+
+    @staticmethod
+    def enabled():
+        return getattr(settings.Messages.Schedule, 'prefetch', 'yes') != 'no'
+
+    def upcoming(self):
+        try:
+            if rsp := self.vcc.get(f'/sessions/next/{self.sta_id}', params={'days': self.days}):
+                return json_decoder(rsp.json())
+        except (VCCError, ValueError) as exc:
+            logger.warning(f'prefetch {str(exc)}')
+        return []
+
+    # Sessions to check now, first to start first
+    def due(self, sessions, now):
+        station = self.sta_id.capitalize()
+        observing = any(ses['start'] <= now < ses['start'] + timedelta(seconds=ses['duration']) for ses in sessions)
+        return sorted([ses for ses in sessions if ses['start'] > now and station not in ses.get('removed', [])
+                       and (not observing or ses['start'] - now < self.lead)], key=lambda ses: ses['start'])
+
+    def prefetch(self, ses_id, urgent):
+        self.checked += 1
+        try:
+            status, text = PrefetchSchedule(self.vcc, self.sta_id, ses_id).run()
+        except Exception as exc:
+            status, text = 'failed', str(exc)
+            for index, line in enumerate(traceback.format_exc().splitlines(), 1):
+                logger.warning(f'prefetch failed - {index:2d} {line.strip()}')
+        logger.info(f'prefetch {ses_id} {status}: {text}')
+        if status == 'updated':
+            self.updated += 1
+        elif status == 'failed':
+            self.failures += 1
+            # Warn operator once if session is about to start
+            if urgent and self.warned.get(ses_id) != text:
+                notify(f'{ses_id.upper()} schedule not ready', text, icon='warning')
+                self.warned[ses_id] = text
+        return status
+
+    def run(self):
+        logger.info(f'prefetch started {self.native_id}')
+        # Random first delay so that stations do not query VCC at the same time
+        wait = random.uniform(self.spacing, 2 * self.spacing)
+        while not self.stopped.wait(wait):
+            wait, now = self.interval, datetime.utcnow()
+            for ses in self.due(self.upcoming(), now):
+                if self.prefetch(ses['code'].lower(), ses['start'] - now < self.lead) != 'unchanged' \
+                        and self.stopped.wait(self.spacing):
+                    break
+
+    def stop(self):
+        logger.info(f'prefetch stop requested')
+        self.stopped.set()
+
+    def metrics(self):
+        return {'prefetch_checked_total': self.checked, 'prefetch_updated_total': self.updated,
+                'prefetch_failures_total': self.failures}
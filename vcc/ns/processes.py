@@ -1,24 +1,23 @@
 import shutil
 import time
-from threading import Thread, Event
 import traceback
 import logging
 import re
 import os
-import json
-import psutil
-import tempfile
 import sys
 
 from collections import namedtuple
-from datetime import datetime, timedelta
 from pathlib import Path
+from threading import Lock
+from weakref import WeakValueDictionary
 
 from vcc import settings, make_path, vcc_cmd, get_inboxes
+from vcc.memory import lock
 from vcc.inbox import show_inbox
-from vcc.ns.drudg import DRUDG
+from vcc.store import MessageStore
+from vcc.ns.drudg import DRUDG, cache
+from vcc.skd import read_schedule, diff_schedules, diff_text
 from vcc.ns import get_displays, show_sessions, notify
-from vcc import json_encoder, json_decoder
 
 
 Addr = namedtuple('addr', 'ip port')
@@ -26,24 +25,16 @@ Addr = namedtuple('addr', 'ip port')
 logger = logging.getLogger('vcc')
 
 
+store = MessageStore(Path(Path(sys.prefix).parent, 'messages', 'ns.jsonl'),
+                     legacy=Path(Path(sys.prefix).parent, 'messages', 'ns.json'))
+
+
+# Processes run concurrently in worker pool. Only one at a time can update ns.jsonl
+@lock
 def send_msg(header, data):
 
     # Save msg in messages directory
-    path = Path(Path(sys.prefix).parent, 'messages', "ns.json")
-    path.touch(exist_ok=True)
-    # Read old records
-    with open(path, 'r') as f:
-        records = json_decoder(json.loads(record)) if (record := f.read()) else []
-        records.append((json_decoder(header), data))
-    # Remove records older than 5 days
-    too_old = datetime.utcnow() - timedelta(days=5)
-    records = [rec for rec in records if rec[0]['utc'] > too_old]
-    # Save to temporary and rename (to avoid overwriting file being read)
-    tmp = tempfile.NamedTemporaryFile(delete=False).name
-    with open(tmp, 'w') as f:
-        f.write(json.dumps(records, default=json_encoder))
-    shutil.move(tmp, str(path), copy_function=shutil.copyfile)
-    path.chmod(0o664)
+    store.append(header, data)
 
     # Start inbox if needed
     inboxes = get_inboxes()
@@ -54,17 +45,30 @@ def send_msg(header, data):
             start_inbox(display)
 
 
-def get_inboxes():
-    inboxes = {}
-    for index, prc in enumerate(psutil.process_iter()):
+# Schedule of a session is processed by only one thread at a time (inbox message or prefetch)
+# Locks are only kept while a thread uses them, so that sessions already processed do not accumulate.
+session_locks, session_locks_guard = WeakValueDictionary(), Lock()
+
+
+def session_lock(ses_id):
+    with session_locks_guard:
+        if (lock := session_locks.get(ses_id)) is None:
+            lock = session_locks[ses_id] = Lock()
+        return lock
+
+
+# Copy of schedule kept before it is replaced by a new version. Used to report changes between versions.
+def previous_path(path):
+    return Path(Path(path).parent, '.previous', Path(path).name)
+
+
+def keep_previous(path):
+    if os.path.exists(path):
         try:
-            if prc.name() == 'vcc':
-                ok = {'inbox', 'NS'}.issubset(prc.cmdline())
-                if {'inbox', 'NS'}.issubset(prc.cmdline()) and (display := prc.environ().get('DISPLAY', None)):
-                    inboxes[display] = prc.pid
-        except (IndexError, Exception):
-            pass
-    return inboxes
+            (previous := previous_path(path)).parent.mkdir(exist_ok=True)
+            shutil.copy2(path, previous)
+        except OSError as exc:
+            logger.warning(f'previous version of {Path(path).name} not kept [{str(exc)}]')
 
 
 def start_inbox(display):
@@ -72,13 +76,11 @@ def start_inbox(display):
     return vcc_cmd('/usr2/vcc/bin/inbox', '', user='oper', group='rtx', env=env)
 
 
-class ProcessSchedule(Thread):
+class ProcessSchedule:
 
     get_name = re.compile('.*filename=\"(?P<name>.*)\".*').match
 
     def __init__(self, vcc, sta_id, headers, data):
-        # calling parent class constructor
-        Thread.__init__(self)
         self.vcc, self.sta_id = vcc, sta_id
         self.ses_id = data.get('session', None) if data else None
         self.headers, self.data = headers, data
@@ -101,7 +103,29 @@ class ProcessSchedule(Thread):
         return [os.path.basename(file) for file in files
                 if os.path.exists(file) and os.stat(file).st_mtime > sched_time]
 
+    # Read schedule before it is replaced. None if not available or not readable
+    @staticmethod
+    def read_previous(path):
+        try:
+            return read_schedule(path) if os.path.exists(path) else None
+        except Exception as exc:
+            logger.warning(f'could not read previous schedule {path} [{str(exc)}]')
+            return None
+
+    # Changes from previous version for this station
+    def changes(self, previous, path):
+        try:
+            diff = diff_schedules(previous, read_schedule(path))
+            return '<br>'.join(diff_text(diff, self.sta_id))
+        except Exception as exc:
+            logger.warning(f'could not compare schedules [{str(exc)}]')
+            return ''
+
     def run(self):
+        with session_lock(self.ses_id):
+            return self.process()
+
+    def process(self):
         # Download schedule (skd first)
         download_option = settings.Messages.Schedule.download.split()[0]
         if download_option == 'no':
@@ -119,10 +143,16 @@ class ProcessSchedule(Thread):
         filename = found['name']
         path = make_path(settings.Folders.schedule, filename)
         modified = self.prc_snp_modified(path, self.ses_id)
+        # File could already be this version if downloaded by prefetcher, which kept the previous one
+        if not path.exists() or path.read_bytes() != rsp.content:
+            keep_previous(path)
+        previous = self.read_previous(previous_path(path))
         self.rename(download_option, path)
         with open(path, 'wb') as f:
             f.write(rsp.content)
         logger.info(f'{filename} downloaded')
+        if previous and (changes := self.changes(previous, path)):
+            self.data['changes'] = changes
         # Execute drudg
         drudg_it = settings.Messages.Schedule.drudg
         if drudg_it == 'no':
@@ -157,17 +187,59 @@ class ProcessSchedule(Thread):
                             make_path(settings.Folders.proc, f'{self.ses_id}{sta_id}.prc')]]
         lst = make_path(settings.Folders.list, f'{self.ses_id}{sta_id}.lst')
         msg.append(f'{os.path.basename(lst)} {"ok" if os.path.exists(lst) else "not created"}')
+        if cache.enabled:
+            msg.append(f'drudg cache {"hit - outputs copied from cache" if proc.cached else "miss"}')
         extra = '<br>'.join(msg)
         self.data['icon'] = 'warning' if err else 'info'
         self.data['processed'] = f"New schedule processed {' - problem drudging it' if err else ''}<br><br>{extra}"
         return send_msg(self.headers, self.data)
 
 
-class ProcessLog(Thread):
-    # overriding constructor
-    def __init__(self, vcc, sta_id, data=None):
-        # calling parent class constructor
-        Thread.__init__(self)
+# Download schedule of upcoming session and drudg it only if its content has changed. Used by Prefetcher.
+# Nothing is done if snp or prc files have been manually modified.
+class PrefetchSchedule(ProcessSchedule):
+
+    def __init__(self, vcc, sta_id, ses_id):
+        super().__init__(vcc, sta_id, {}, {'session': ses_id})
+
+    # Schedule has same content and was drudged
+    def ready(self, path, content):
+        if not path.exists() or path.read_bytes() != content:
+            return False
+        modified = path.stat().st_mtime
+        name = f'{self.ses_id}{self.sta_id.lower()}'
+        return all(file.exists() and file.stat().st_mtime == modified
+                   for file in [Path(settings.Folders.snap, f'{name}.snp'), Path(settings.Folders.proc, f'{name}.prc')])
+
+    # Return status (unchanged, updated, skipped or failed) and explanation
+    def process(self):
+        download_option = settings.Messages.Schedule.download.split()[0]
+        if download_option == 'no':
+            return 'skipped', 'configuration set to NO'
+        if not (rsp := self.vcc.get(f'/schedules/{self.ses_id}')):
+            return 'failed', f'Problem downloading schedule {rsp.text}'
+        if not (found := self.get_name(rsp.headers['content-disposition'])):
+            return 'failed', f"Problem downloading schedule {rsp.headers['content-disposition']}"
+        filename = found['name']
+        path = Path(settings.Folders.schedule, filename)
+        if self.ready(path, rsp.content):
+            return 'unchanged', f'{filename} already processed'
+        if modified := self.prc_snp_modified(path, self.ses_id):
+            return 'skipped', f'{", ".join(modified)} manually modified'
+        keep_previous(path)
+        self.rename(download_option, path)
+        with open(path, 'wb') as f:
+            f.write(rsp.content)
+        logger.info(f'{filename} prefetched')
+        if settings.Messages.Schedule.drudg == 'no':
+            return 'updated', f'{filename} downloaded but not processed'
+        if err := DRUDG(self.ses_id, self.sta_id.lower()).drudg(filename):
+            return 'failed', f'Problem DRUDGing {filename}: {err}'
+        return 'updated', f'{filename} downloaded and processed'
+
+
+class ProcessLog:
+    def __init__(self, vcc, sta_id, headers=None, data=None):
         self.vcc, self.sta_id = vcc, sta_id
         self.data = data if data else {}
 
@@ -176,12 +248,9 @@ class ProcessLog(Thread):
             vcc_cmd('fslog', f'-C {self.sta_id} {ses_id}')
 
 
-class ProcessMsg(Thread):
+class ProcessMsg:
 
-    # overriding constructor
     def __init__(self, vcc, sta_id, headers, data):
-        # calling parent class constructor
-        Thread.__init__(self)
         self.vcc, self.sta_id = vcc, sta_id
         self.headers, self.data = headers, data
 
@@ -0,0 +1,177 @@
+import re
+import sys
+import time
+import logging
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from threading import Thread, Event, Lock
+
+from vcc import settings, make_object
+from vcc.fslog import fs2time, time2fs
+from vcc.ns import ddout
+
+"""
+Replay a recorded FS log at real-time or N times speed and measure how DDoutScanner behaves.
+The log is rewritten line by line in a temporary log folder with timestamps shifted to current time.
+DDoutScanner reads it with get_ddout_log stubbed and sends its events to a local stand-in VCC server.
+"""
+
+logger = logging.getLogger('vcc')
+
+is_pcfs = re.compile(r'^(?P<time>\d{4}\.\d{3}\.\d{2}:\d{2}:\d{2}\.\d{2})(?P<data>.*)$', re.DOTALL).match
+
+
+# Response returned by stand-in server
+class Response:
+    def __init__(self, data=None, status_code=200):
+        self.data, self.status_code = data, status_code
+        self.text, self.headers = '' if status_code < 400 else 'not found', {}
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def json(self):
+        return self.data
+
+
+# Write recorded log into replay folder using original time intervals divided by speed
+class LogWriter(Thread):
+    def __init__(self, source, destination, speed=1.0):
+        super().__init__()
+
+        self.source, self.destination, self.speed = source, destination, speed
+        self.stopped, self.lock = Event(), Lock()
+        self.written, self.offset, self.lines = {}, 0, 0
+
+    # Monotonic time when line ending at offset was written
+    def written_at(self, offset):
+        with self.lock:
+            return self.written.get(offset)
+
+    def run(self):
+        first = start = None
+        with open(self.source, 'r', encoding='utf8', errors='ignore') as src, \
+                open(self.destination, 'a', encoding='utf-8') as log:
+            for line in src:
+                if self.stopped.is_set():
+                    break
+                if rec := is_pcfs(line):
+                    timestamp = fs2time(rec['time'])
+                    if first is None:
+                        first, start = timestamp, time.time()
+                    if self.speed and (wait := start + (timestamp - first) / self.speed - time.time()) > 0:
+                        if self.stopped.wait(wait):
+                            break
+                    line = f'{time2fs(time.time())}{rec["data"]}'
+                log.write(line)
+                log.flush()
+                with self.lock:
+                    self.offset += len(line.encode('utf-8'))
+                    self.written[self.offset] = time.monotonic()
+                self.lines += 1
+
+    def stop(self):
+        self.stopped.set()
+
+
+# Stand-in for VCC server. Count requests per endpoint and measure latency of status events
+class StandIn:
+    def __init__(self, writer):
+        self.writer, self.scanner = writer, None
+        self.requests, self.latency = defaultdict(int), []
+        self.group_id = 'NS'
+
+    @staticmethod
+    def endpoint(path):
+        return '/'.join(path.split('/')[:3]) if path.startswith('/messages') or path.startswith('/data') \
+            else '/'.join(path.split('/')[:2])
+
+    def get(self, path, params=None, headers=None, timeout=None):
+        self.requests[f'GET {self.endpoint(path)}'] += 1
+        if path.startswith('/sessions/'):
+            return Response({'code': path.split('/')[-1]})
+        return Response(None, 404)
+
+    def post(self, path, data=None, files=None, headers=None, params=None):
+        self.requests[f'POST {self.endpoint(path)}'] += 1
+        if path == '/messages/status' and self.scanner and (written := self.writer.written_at(self.scanner.offset)):
+            self.latency.append(time.monotonic() - written)
+        return Response({})
+
+
+def percentile(values, pct):
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0
+
+
+def replay(path, sta_id=None, speed=1.0, timeout=30):
+    path = Path(path)
+    sta_id = sta_id or path.stem[-2:]
+    folder = Path(tempfile.mkdtemp(prefix='vcc-replay-'))
+    Path(folder, 'vcc').mkdir()
+    # Use replay folder for checkpoint and spool of DDoutScanner
+    make_object({'Folders': {'log': str(folder)}}, settings)
+
+    writer = LogWriter(path, Path(folder, path.name), speed)
+    server = StandIn(writer)
+    logs = defaultdict(int)
+    writer.destination.touch()
+    ddout.get_ddout_log = lambda *args: writer.destination
+    ddout.vcc_cmd = lambda action, options, **kwargs: logs.__setitem__(action, logs[action] + 1)
+    scanner = server.scanner = ddout.DDoutScanner(sta_id, server)
+
+    # Make sure scanner has opened empty log before writing
+    scanner.start()
+    while scanner.log is None:
+        time.sleep(0.01)
+    cpu, t0 = time.process_time(), time.time()
+    writer.start()
+    writer.join()
+    # Wait until scanner has read everything
+    end = time.time() + timeout
+    while scanner.offset < writer.offset and time.time() < end:
+        time.sleep(0.01)
+    elapsed, cpu = time.time() - t0, time.process_time() - cpu
+    scanner.stop()
+    scanner.join()
+
+    latency = sorted(server.latency)
+    print(f'Replay of {path.name} at {f"{speed:g}x" if speed else "full"} speed in {folder}')
+    print(f'{writer.lines:d} lines in {elapsed:.3f} seconds ({writer.lines / elapsed:.0f} lines/s)')
+    print(f'CPU {cpu:.3f} seconds ({100 * cpu / elapsed:.1f}%)')
+    if latency:
+        print(f'{len(latency):d} events latency (ms) min {1000 * latency[0]:.1f} '
+              f'median {1000 * percentile(latency, 50):.1f} p95 {1000 * percentile(latency, 95):.1f} '
+              f'max {1000 * latency[-1]:.1f}')
+    for name, nbr in sorted(server.requests.items()):
+        print(f'{name:30s} {nbr:6d}')
+    for name, nbr in logs.items():
+        print(f'{name:30s} {nbr:6d} commands')
+    if scanner.offset < writer.offset:
+        print(f'scanner did not read {writer.offset - scanner.offset} bytes')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay FS log to benchmark DDoutScanner', prog='replay')
+    parser.add_argument('-s', '--speed', help='replay speed (0 for no delay)', type=float, default=1.0)
+    parser.add_argument('-S', '--station', help='station code (default from log name)', required=False)
+    parser.add_argument('-t', '--timeout', help='time to wait for scanner', type=float, default=30)
+    parser.add_argument('-D', '--debug', help='output vcc logger on console', action='store_true')
+    parser.add_argument('path', help='recorded FS log')
+
+    args = parser.parse_args()
+    if not Path(args.path).exists():
+        print(f'{args.path} does not exist')
+        return 1
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(logging.StreamHandler())
+    replay(args.path, args.station, args.speed, args.timeout)
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -2,35 +2,82 @@ import re
 import sys
 import signal
 import logging
+import logging.handlers
 import shutil
 from pathlib import Path
 from datetime import datetime
+from queue import SimpleQueue
 
 from threading import Thread, Event
 
-from vcc import settings
+from vcc import settings, make_object
 from vcc.client import VCC
 from vcc.ns.monit import InboxMonitor
-from vcc.ns.ddout import DDoutScanner
+from vcc.ns.ddout import DDoutLoop
+from vcc.ns.onoff import OnoffSpool
+from vcc.ns.prefetch import Prefetcher
+from vcc.ns.drudg import cache as drudg_cache
+from vcc.metrics import registry, start_exporter
 
 logger = logging.getLogger('vcc')
 
 """
 VCC NS client monitoring LOG file and NS inbox.
-DDoutScanner monitors the current log and send specific information to VCC
+DDoutScanner monitors the current log and send specific information to VCC.
+Logs of all stations defined in [Stations] section are scanned by the same DDoutLoop thread.
 InboxTracker monitors NS inbox on VCC and dispatches message to appropriate function
+Prefetcher downloads and drudges schedules of upcoming sessions
+Metrics are exported in a textfile or on localhost when defined in [Metrics] section
 """
 
 
 class ContextFilter(logging.Filter):
     """
-    Class to format UTC time in log
+    Class to format UTC time in log. Time is the creation time of the record, not the time it is written.
+    Date and time to the second are formatted only once per second.
     """
+    def __init__(self):
+        super().__init__()
+        self.second, self.prefix = None, ''
+
     def filter(self, record):
-        record.utc = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        if (second := int(record.created)) != self.second:
+            self.second, self.prefix = second, datetime.utcfromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+        record.utc = f'{self.prefix}.{int(record.msecs):03d}'
         return True
 
 
+class RepeatFilter(logging.Filter):
+    """
+    Class dropping same message repeated within interval seconds. The number of dropped messages is added
+    to the next one that is written.
+    """
+    def __init__(self, interval):
+        super().__init__()
+        self.interval, self.messages = interval, {}
+
+    def filter(self, record):
+        now, key = record.created, (record.levelno, record.getMessage())
+        first, count = self.messages.get(key, (0, 0))
+        if now - first < self.interval:
+            self.messages[key] = (first, count + 1)
+            return False
+        if len(self.messages) > 1000:
+            self.messages = {k: v for k, v in self.messages.items() if now - v[0] < self.interval}
+        self.messages[key] = (now, 0)
+        if count:
+            record.msg, record.args = f'{key[1]} (repeated {count} times)', None
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Class queuing records for the listener thread. Records are not formatted by the thread logging them.
+    """
+    def prepare(self, record):
+        return record
+
+
 class VCChandler(logging.handlers.WatchedFileHandler):
     """
     Class checking if log has been moved or deleted. Re-open it if needed
@@ -59,44 +106,91 @@ class VCCmon(Thread):
     Class used to monitor VCC inbox and DDOUT continuously
     ddout and inbox are using separated threads
     """
-    def __init__(self, sta_id, logging_level=logging.INFO):
+    def __init__(self, sta_id, logging_level=logging.INFO, repeat=0):
 
         super().__init__()
 
         signal.signal(signal.SIGTERM, self.terminate)
 
-        # define logger parameters
+        # define logger parameters. Records are written to file by listener thread
         handler = VCChandler(Path(settings.Folders.log, 'vcc', 'vccmon.log'))
         handler.setFormatter(logging.Formatter('%(utc)s [%(levelname)s] %(message)s'))
-        logger.addFilter(ContextFilter())
+        if repeat:
+            handler.addFilter(RepeatFilter(repeat))
+        handler.addFilter(ContextFilter())
+        queue = SimpleQueue()
+        self.listener = logging.handlers.QueueListener(queue, handler)
+        self.listener.start()
         logger.setLevel(logging_level)
-        logger.addHandler(handler)
+        logger.addHandler(QueueHandler(queue))
 
         self.sta_id, self.stopped = sta_id, Event()
 
+    # Scanners for NS station and other stations defined in [Stations] section. Each station may have its own
+    # lognm command, log folder and signature (code, uid and optional private key). All scanners share the tunnel
+    # and the onoff spool.
+    def make_loop(self, vcc):
+        stations = {key.lower(): info for key, info in vars(getattr(settings, 'Stations', make_object({}))).items()}
+        loop = DDoutLoop(OnoffSpool(vcc))
+        main = stations.pop(self.sta_id.lower(), None)
+        loop.add(self.sta_id, vcc, getattr(main, 'lognm', 'lognm'), getattr(main, 'log', '/usr2/log'), 'ddout.ckpt')
+        for sta_id, info in stations.items():
+            client = vcc.identity(*info.signature[:3]) if hasattr(info, 'signature') else vcc
+            loop.add(sta_id, client, getattr(info, 'lognm', 'lognm'), getattr(info, 'log', '/usr2/log'))
+        return loop
+
+    # Values exported with metrics of VCC requests
+    @staticmethod
+    def register_metrics(loop, threads):
+        for scanner in loop.scanners:
+            registry.collect(scanner.metrics, station=scanner.sta_id)
+        registry.collect(loop.spool.metrics)
+        registry.collect(drudg_cache.metrics)
+        for prc in threads:
+            if pool := getattr(prc, 'pool', None):
+                registry.collect(pool.metrics)
+            elif hasattr(prc, 'metrics'):
+                registry.collect(prc.metrics)
+        for prc in threads + [loop.spool]:
+            registry.collect(lambda thread=prc: {'thread_alive': int(thread.is_alive())},
+                             thread=prc.__class__.__name__)
+
     def run(self):
         logger.info(f'vccmon started {self.native_id}')
         not_connected = False
 
-        with VCC('NS') as vcc:
-            threads = [DDoutScanner(self.sta_id, vcc), InboxMonitor(self.sta_id, vcc)]
-            for prc in threads:
-                prc.start()
-            while not self.stopped.wait(5):
-                if not vcc.is_available:
-                    if not_connected:
-                        logger.info('not connected to vcc')
-                        not_connected = True
-                elif not_connected:
-                    logger.info('re-connected tp vcc')
-                    not_connected = False
-
-            # Terminated. Close all connections
-            for prc in reversed(threads):
-                prc.stop()
-            for prc in reversed(threads):
-                prc.join()
-        logger.info('vccmon stopped')
+        try:
+            with VCC('NS') as vcc:
+                loop = self.make_loop(vcc)
+                threads = [loop, InboxMonitor(self.sta_id, vcc)]
+                if Prefetcher.enabled():
+                    threads.append(Prefetcher(self.sta_id, vcc))
+                self.register_metrics(loop, threads)
+                exporter = start_exporter(getattr(settings, 'Metrics', None))
+                for prc in threads:
+                    prc.start()
+                while not self.stopped.wait(5):
+                    if not vcc.is_available:
+                        if not_connected:
+                            logger.info('not connected to vcc')
+                            not_connected = True
+                    elif not_connected:
+                        logger.info('re-connected tp vcc')
+                        not_connected = False
+
+                # Terminated. Close all connections
+                for prc in reversed(threads):
+                    prc.stop()
+                for prc in reversed(threads):
+                    prc.join()
+                if exporter:
+                    exporter.stop()
+            logger.info('vccmon stopped')
+        except Exception as exc:
+            logger.error(f'vccmon failed [{str(exc)}]')
+            raise
+        finally:
+            self.listener.stop()
         sys.exit(0)
 
     def terminate(self, sig, alarm):
@@ -111,6 +205,8 @@ def main():
     parser = argparse.ArgumentParser(description='Network Station', prog='vccmon', add_help=False)
     parser.add_argument('-c', '--config', help='config file', required=False)
     parser.add_argument('-D', '--debug', help='debug mode is on', action='store_true')
+    parser.add_argument('-R', '--repeat', help='seconds before writing same message again', type=float,
+                        default=0)
 
     args = settings.init(parser.parse_args())
 
@@ -119,7 +215,7 @@ def main():
         sys.exit(1)
     level = logging.DEBUG if args.debug else logging.INFO
     try:
-        VCCmon(sta_id, logging_level=level).start()
+        VCCmon(sta_id, logging_level=level, repeat=args.repeat).start()
     except Exception as exc:
         logger.debug(f'end {str(exc)}')
         sys.exit(1)
@@ -76,8 +76,10 @@ class Session:
 
     @property
     def sched_version(self):
-        return f'V{self.schedule.version:.0f} {self.schedule.updated.strftime("%Y-%m-%d %H:%M")}' \
-            if self.schedule else 'None'
+        if not self.schedule:
+            return 'None'
+        version = f'V{self.schedule.version:.0f}' if self.schedule.version else 'Local file'
+        return f'{version} {self.schedule.updated.strftime("%Y-%m-%d %H:%M")}'
 
     @property
     def start_date(self):
@@ -1,30 +1,180 @@
+from array import array
 from collections import OrderedDict, defaultdict
+from functools import lru_cache, partial
+from itertools import combinations
+from pathlib import Path
 import string
 from operator import itemgetter
+import hashlib
+import json
+import logging
+import mmap
 import os
 import re
 
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-_UTC_FORMATS = {'sked': '%Y%j%H%M%S', 'skd': '%y%j%H%M%S', 'vex': '%Yy%jd%Hh%Mm%Ss'}
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+from vcc import settings
 
-def utc(*args, **kwargs):
-    def decode(fmt_name, text):
-        if fmt_name == 'vex' and '24h' in text:
-            return datetime.strptime(text[:9], '%Yy%jd') + timedelta(days=1)
-        elif fmt_name == 'skd' and text[-6:] == '240000':
-            return datetime.strptime(text[:5], '%y%j') + timedelta(days=1)
-        return datetime.strptime(text, _UTC_FORMATS[fmt_name])
+logger = logging.getLogger('vcc')
+
+PARSER_VERSION = 2  # Change when parsed information changes so that cached schedules are not used
+
+_UTC_FORMATS = {'sked': '%Y%j%H%M%S', 'skd': '%y%j%H%M%S', 'vex': '%Yy%jd%Hh%Mm%Ss', 'snap': '!%Y.%j.%H:%M:%S'}
+
+
+# (year, month, day) for year * 1000 + day of year. None if not valid so that strptime decides what to do.
+@lru_cache(maxsize=1024)
+def _date_of(year_doy):
+    year, doy = divmod(year_doy, 1000)
+    try:
+        return (date(year, 1, 1) + timedelta(doy - 1)).timetuple()[:3] if 0 < doy < 367 else None
+    except (ValueError, OverflowError):
+        return None
+
+
+# Time from YYYYDDDHHMMSS number
+def _from_number(value):
+    rest, second = divmod(value, 100)
+    rest, minute = divmod(rest, 100)
+    year_doy, hour = divmod(rest, 100)
+    if (ymd := _date_of(year_doy)) and hour < 24 and minute < 60 and second < 60:
+        return datetime(*ymd, hour, minute, second)
+    return None
+
+
+def _next_day(year_doy):
+    return datetime(*ymd) + timedelta(days=1) if (ymd := _date_of(year_doy)) else None
+
+
+# Fast decoders of fixed format times used in schedules. Digits are converted to one number instead of using strptime.
+def _decode_sked(text):  # 2024101173000
+    return _from_number(int(text)) if len(text) == 13 and text.isdigit() else None
+
+
+def _decode_skd(text):  # 24101173000 with 240000 for start of next day
+    if len(text) == 11 and text.isdigit():
+        value = int(text) + (2000 if text[:2] < '69' else 1900) * 1000000000
+        return _next_day(value // 1000000) if text[5:] == '240000' else _from_number(value)
+    return None
 
+
+def _decode_vex(text):  # 2024y101d17h30m00s with 24h for start of next day
+    if len(text) == 18 and text[4] + text[8] + text[11] + text[14] + text[17] == 'ydhms' \
+            and (digits := text[:4] + text[5:8] + text[9:11] + text[12:14] + text[15:17]).isdigit():
+        return _next_day(int(digits[:7])) if digits[7:9] == '24' else _from_number(int(digits))
+    return None
+
+
+def _decode_snap(text):  # !2024.101.17:30:00
+    if len(text) == 18 and text[0] + text[5] + text[9] + text[12] + text[15] == '!..::' \
+            and (digits := text[1:5] + text[6:9] + text[10:12] + text[13:15] + text[16:]).isdigit():
+        return _from_number(int(digits))
+    return None
+
+
+_DECODERS = {'sked': _decode_sked, 'skd': _decode_skd, 'vex': _decode_vex, 'snap': _decode_snap}
+
+
+def _decode_slow(fmt_name, text):
+    if fmt_name == 'vex' and '24h' in text:
+        return datetime.strptime(text[:9], '%Yy%jd') + timedelta(days=1)
+    elif fmt_name == 'skd' and text[-6:] == '240000':
+        return datetime.strptime(text[:5], '%y%j') + timedelta(days=1)
+    return datetime.strptime(text, _UTC_FORMATS[fmt_name])
+
+
+def utc(*args, **kwargs):
     for key, value in kwargs.items():
         if key in _UTC_FORMATS:
-            return decode(key, value)
+            return _DECODERS[key](value) or _decode_slow(key, value)
     # Value and format are provided as argument 0 and 1
     return datetime.strptime(args[0], args[1])
 
 
+# Compare fast decoders with strptime
+def benchmark_utc(number=100000):
+    import timeit
+
+    samples = {'sked': '2024101173000', 'skd': '24101173000', 'vex': '2024y101d17h30m00s', 'snap': '!2024.101.17:30:00'}
+    for name, text in samples.items():
+        fast = timeit.timeit(lambda: utc(**{name: text}), number=number)
+        slow = timeit.timeit(lambda: datetime.strptime(text, _UTC_FORMATS[name]), number=number)
+        print(f'{name:5s} {1e6 * fast / number:6.2f} us strptime {1e6 * slow / number:6.2f} us ({slow / fast:.1f}x)')
+
+
+# Records of schedule use __slots__ to keep memory small on large schedules.
+# Fields can still be read like dictionary items (record['name']) by older code.
+class Record:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class Station(Record):
+    __slots__ = ('index', 'name', 'code', 'key', 'first_source', 'scans', 'scheduled_obs')
+
+    def __init__(self, index, code='', name='', key=''):
+        self.index, self.code, self.name, self.key = index, code, name, key
+        self.first_source, self.scans, self.scheduled_obs = '', {}, 0
+
+
+class Source(Record):
+    __slots__ = ('index', 'name', 'code', 'scans', 'scheduled_obs')
+
+    def __init__(self, index, code='', name=''):
+        self.index, self.code, self.name = index, code, code if name == '$' else name
+        self.scans, self.scheduled_obs = {}, 0
+
+
+# Scan with stations stored as integer ids (index in codes of schedule) and durations in arrays sorted by code
+class Scan(Record):
+    __slots__ = ('name', 'source', 'start', 'ids', 'durations', 'codes')
+
+    def __init__(self, name, source, start, codes, ids, durations):
+        self.name, self.source, self.start, self.codes = name, source, start, codes
+        self.ids, self.durations = array('H', ids), array('I', durations)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return isinstance(other, Scan) and (self.name, self.source, self.start) == (other.name, other.source,
+                                                                                    other.start) \
+            and self.members() == other.members()
+
+    # Station codes and durations
+    def members(self):
+        return list(zip([self.codes[i] for i in self.ids], self.durations))
+
+    def duration(self, code):
+        return self.durations[self.ids.index(self.codes.index(code))]
+
+    def remove(self, index):
+        if index in self.ids:
+            i = self.ids.index(index)
+            del self.ids[i]
+            del self.durations[i]
+
+    # Compatibility view of stations {code: {'duration': duration}}. Made on demand, not kept in memory.
+    @property
+    def station_codes(self):
+        return OrderedDict([(code, {'duration': duration}) for code, duration in self.members()])
+
+
 class SKD:
     def __init__(self, path):
         self.path, self.file = path, None
@@ -32,9 +182,9 @@ class SKD:
 
         self.scheduling_software, self.session_code = 'SKED', ''
         self.stations = {'names': {}, 'codes': {}, 'keys': {}, 'removed': []}
+        self.codes = []  # Station codes by station id
         self.sources, self.scans = {}, {}
-        self.observations, self.baselines = OrderedDict(), OrderedDict()
-        self.obs_list = []
+        self.baselines, self.pairs = OrderedDict(), []
         self.scheduled_obs = 0
         self.missed = []
         self.valid = os.path.exists(path)
@@ -75,43 +225,47 @@ class SKD:
                     return self.line.startswith(start_word)
         return False
 
+    # Same session with same observations. Scans without baseline have no observations.
     def __eq__(self, other):
-        if self.session_code != other.session_code or \
-                self.scheduled_obs != other.scheduled_obs or \
-                len(self.observations) != len(other.observations):
+        if self.session_code != other.session_code or self.scheduled_obs != other.scheduled_obs:
             return False
 
-        def is_same(first, second):
-
-            if isinstance(first, dict):
-                if len(first) != len(second):
-                    return False
-                for (k1, v1), (k2, v2) in zip(first.items(), second.items()):
-                    if k1 != k2 or not is_same(v1, v2):
-                        return False
-            if isinstance(first, list):
-                if len(first) != len(second):
-                    return False
-                for one, two in zip(first, second):
-                    if not is_same(one, two):
-                        return False
-            elif first != second:
-                return False
-            return True
+        def observed(skd):
+            return [scan for scan in skd.scans.values() if len(scan) > 1]
 
-        # Check if same observations
-        for (skd, skd_obs), (vex, vex_obs) in zip(self.observations.items(), other.observations.items()):
-            if skd != vex:
-                return False
-            for (skd_key, skd_data), (vex_key, vex_data) in zip(skd_obs.items(), vex_obs.items()):
-                if skd_key != vex_key or not is_same(skd_data, vex_data):
-                    return False
-        return True
+        return observed(self) == observed(other)
 
     @property
     def is_vex(self):
         return self.__class__.__name__ == 'VEX'
 
+    # Observations by source and baseline {source: {fr: {to: [obs]}}}. Made on demand from scans.
+    @property
+    def observations(self):
+        observations = OrderedDict()
+        for obs in self.obs_list:
+            observations.setdefault(obs['scan'].source, {}).setdefault(obs['fr'], {}).setdefault(obs['to'], []) \
+                .append(obs)
+        return observations
+
+    @property
+    def obs_list(self):
+        return [SKD.init_obs(scan, fr, to) for scan in self.scans.values()
+                for fr, to in combinations([self.codes[i] for i in scan.ids], 2)]
+
+    def add_station(self, code, name, key=''):
+        sta = SKD.init_sta(code, name, key, index=len(self.codes))
+        self.codes.append(code)
+        self.stations['codes'][code] = self.stations['names'][name] = sta
+        if key:
+            self.stations['keys'][key] = sta
+        return sta
+
+    def add_source(self, code, name):
+        src = SKD.init_src(code, name, index=len(self.sources))
+        self.sources[src.name] = src
+        return src
+
     def section_not_used(self, line):
         pass
 
@@ -130,26 +284,22 @@ class SKD:
         if line.startswith('A'):
             info = line.split()
             key, name, code = [info[i] for i in [1, 2, 14]]
-            sta = SKD.init_sta(code, name, key)
-            self.stations['codes'][code] = self.stations['names'][name] = self.stations['keys'][key] = sta
+            self.add_station(code, name, key)
 
     def section_sources(self, line):
         code, name = (line.split()[0:2])
-        src = SKD.init_src(code, name)
-        self.sources[src['name']] = src
+        self.add_source(code, name)
 
     def section_sked(self, line):
         info = line.split()
         start = utc(skd=info[4])
         name = start.strftime('%j-%H%M')
-        scan = SKD.init_scan(name, info[0], start)
         # Extract stations
-        scan['ids'] = {}
         n = int(len(info[9]) / 2)
         if int(n * 2) != len(info[9]):
-            self.warnings.add(f'Problem with scan {info[0]} {info[4]}')
+            self.warnings.append(f'Problem with scan {info[0]} {info[4]}')
             return
-        scan['ids'] = {k: int(info[i]) for i, k in enumerate(info[9][::2], 11+n)}
+        scan = (name, info[0], start, [(k, int(info[i])) for i, k in enumerate(info[9][::2], 11+n)])
         self.scans[name].append(scan) if name in self.scans else self.scans.update({name: [scan]})
 
     # Read skd file ans extract information
@@ -180,129 +330,216 @@ class SKD:
         scans, self.scans = dict(sorted(self.scans.items())), OrderedDict()
         for name, scan in scans.items():
             if len(scan) == 1:
-                end = self.add_scan(scan[0])
+                end = self.add_scan(*scan[0])
             else:
-                scan = sorted(scan, key=lambda i: (i['start'], i['source'])) if sort_source else \
-                    sorted(scan, key=lambda i: i['start'])
-                for index, rec in zip(string.ascii_lowercase, scan):
-                    rec['name'] = f'{rec["name"]}{index}'
-                    end = self.add_scan(rec)
+                scan = sorted(scan, key=itemgetter(2, 1)) if sort_source else sorted(scan, key=itemgetter(2))
+                for index, (scan_name, source, start, keys) in zip(string.ascii_lowercase, scan):
+                    end = self.add_scan(f'{scan_name}{index}', source, start, keys)
         if not hasattr(self, 'end'):
             self.end = end
 
         self.set_first_sources()
         self.count_observations()
 
-    def add_scan(self, scan):
+    # Add scan with list of (station key, duration)
+    def add_scan(self, name, source, start, keys):
         if not hasattr(self, 'start'):
-            self.start = scan['start']
+            self.start = start
 
-        # Add scan to scans
-        name = scan['name']
-        if name in self.scans:
+        stations = self.stations['keys']
+        members = [(stations[key].index, duration) for key, duration in keys if key in stations]
+        return self.insert_scan(name, source, start, members)
+
+    # Insert scan with list of (station id, duration)
+    def insert_scan(self, name, source, start, members):
+        return self.register(SKD.init_scan(name, source, start, self.codes, members))
+
+    # Add scan to schedule, its stations and source. Return end of scan
+    def register(self, scan):
+        if (name := scan.name) in self.scans:
             self.warnings.append(f'duplicate scan {name}')
-        self.scans[name] = scan;
-
-        scan_duration = 0
-        for key, duration in scan['ids'].items():
-            if key in self.stations['keys']:
-                scan_duration = max(duration, scan_duration)
-                code = self.stations['keys'][key]['code']
-                scan['station_codes'][code] = {'duration': duration}
-                self.stations['codes'][code]['scans'][name] = scan
-        scan.pop('ids')
-        scan['station_codes'] = OrderedDict(sorted(scan['station_codes'].items()))
-
-        # Update sources dict
-        source = scan['source']
-        if source not in self.observations:
-            self.observations[source] = {}
-        src = self.observations[source]
-        for fr in scan['station_codes']:
-            if fr not in src:
-                src[fr] = {}
-            for to in scan['station_codes']:
-                if fr < to:
-                    if to not in src[fr]:
-                        src[fr][to] = []
-                    obs = SKD.init_obs(scan, fr, to)
-                    src[fr][to].append(obs)
-                    self.obs_list.append(obs)
-
-        return scan['start'] + timedelta(seconds=scan_duration)
+        self.scans[name] = scan
+        for index in scan.ids:
+            self.stations['codes'][self.codes[index]].scans[name] = scan
+        if src := self.sources.get(scan.source):
+            src.scans[name] = scan
+        return scan.start + timedelta(seconds=max(scan.durations, default=0))
+
+    # Compact representation of parsed schedule. Scan start times are seconds since start of schedule.
+    def dump(self):
+        base = self.start or min([scan.start for scan in self.scans.values()], default=datetime(2000, 1, 1))
+        stations = [self.stations['codes'][code] for code in self.codes]
+        return {'software': self.scheduling_software, 'session': self.session_code, 'correlator': self.correlator,
+                'start': self.start and self.start.isoformat(), 'end': self.end and self.end.isoformat(),
+                'base': base.isoformat(), 'stations': [[sta.code, sta.name, sta.key] for sta in stations],
+                'sources': [[src.code, src.name] for src in self.sources.values()],
+                'scans': [[scan.name, scan.source, int((scan.start - base).total_seconds()), scan.ids.tolist(),
+                           scan.durations.tolist()] for scan in self.scans.values()],
+                'errors': self.errors, 'warnings': self.warnings}
+
+    # Make schedule from dump
+    @classmethod
+    def load(cls, path, data):
+        skd = cls(path)
+        skd.scheduling_software, skd.session_code = data['software'], data['session']
+        skd.correlator, skd.errors, skd.warnings = data['correlator'], data['errors'], data['warnings']
+        skd.start, skd.end = [datetime.fromisoformat(text) if text else None for text in (data['start'], data['end'])]
+        for code, name, key in data['stations']:
+            skd.add_station(code, name, key)
+        for code, name in data['sources']:
+            skd.add_source(code, name)
+        base = datetime.fromisoformat(data['base'])
+        for name, source, offset, ids, durations in data['scans']:
+            skd.register(Scan(name, source, base + timedelta(seconds=offset), skd.codes, ids, durations))
+        skd.set_first_sources()
+        skd.count_observations()
+        return skd
 
     def set_first_sources(self):
         # Set first sources
         for code, sta in self.stations['codes'].items():
             if len(sta['scans']) > 0:
-                sta['first_source'] = list(sta['scans'].values())[0]['source']
+                sta.first_source = next(iter(sta.scans.values())).source
+
+    # Scans x stations matrix with 1 when station is in scan, and number of stations in each scan
+    def incidence_matrix(self, scans):
+        size = numpy.array([len(scan.ids) for scan in scans], dtype=numpy.int64)
+        ids = numpy.frombuffer(b''.join([scan.ids.tobytes() for scan in scans]), dtype=numpy.uint16)
+        matrix = numpy.zeros((len(scans), len(self.codes)))
+        matrix[numpy.repeat(numpy.arange(len(scans)), size), ids] = 1
+        return matrix, size
+
+    # Number of observations by station id and by source name, and number of scans by pair of station ids.
+    # Uses a scans x stations incidence matrix so that all baselines are counted by one matrix product.
+    def incidence_counts(self):
+        scans = list(self.scans.values())
+        if numpy is None or not scans:
+            return self.loop_counts(scans)
+        matrix, size = self.incidence_matrix(scans)
+        nbr_obs = size - 1
+        index = {name: i for i, name in enumerate(self.sources)}
+        sources = numpy.bincount([index.get(scan.source, len(index)) for scan in scans],
+                                 weights=nbr_obs * size // 2, minlength=len(index) + 1)
+        stations, pairs = matrix.T @ nbr_obs, matrix.T @ matrix
+        return stations.astype(int).tolist(), {name: int(sources[i]) for name, i in index.items()}, \
+            pairs.astype(int).tolist()
+
+    # Same as incidence_counts without numpy. Scans of each station are kept in an integer with one byte per scan
+    # so that scans common to a baseline are counted with & and the number of 1 bits.
+    def loop_counts(self, scans):
+        stations, sources = [0] * len(self.codes), defaultdict(int)
+        flags = [bytearray(len(scans)) for _ in self.codes]
+        for row, scan in enumerate(scans):
+            nbr_obs = len(scan.ids) - 1
+            for index in scan.ids:
+                stations[index] += nbr_obs
+                flags[index][row] = 1
+            sources[scan.source] += nbr_obs * (nbr_obs + 1) // 2
+        masks = [int.from_bytes(flag, 'little') for flag in flags]
+        pairs = [[bin(fr & to).count('1') for to in masks] for fr in masks]
+        return stations, {name: sources.get(name, 0) for name in self.sources}, pairs
 
     def count_observations(self):
-        # Count observations for stations
-        scheduled = 0
-        for code, sta in self.stations['codes'].items():
-            nbr_obs = 0
-            for scan in sta['scans'].values():
-                nbr_obs += len(scan['station_codes']) - 1
-            sta['scheduled_obs'] = nbr_obs
-            scheduled += nbr_obs
-        self.scheduled_obs = int(scheduled / 2)
-
-        # Count observations for sources
+        stations, sources, self.pairs = self.incidence_counts()
+        for code, nbr_obs in zip(self.codes, stations):
+            self.stations['codes'][code].scheduled_obs = nbr_obs
+        self.scheduled_obs = sum(stations) // 2
         for name, src in self.sources.items():
-            if name in self.observations:
-                obs = self.observations[name]
-                nbr_obs = 0
-                for fr, info in obs.items():
-                    for to, scans in info.items():
-                        nbr_obs += len(scans)
-                src['scheduled_obs'] += nbr_obs
-
-        # Count observations for baselines
-        names = sorted(self.stations['names'].keys())
-        for index, fr in enumerate(names):
-            sta = self.stations['names'][fr]
-            for to in names[index+1:]:
-                nbr_obs = 0
-                code = self.stations['names'][to]['code']
-                for scan in sta['scans'].values():
-                    if code in scan['station_codes']:
-                        nbr_obs += 1
-                self.baselines[f'{fr}-{to}'] = nbr_obs
+            src.scheduled_obs = sources[name]
+        self.make_baselines()
 
+    # Baselines are named using station names in alphabetical order
+    def make_baselines(self):
+        names = sorted(self.stations['names'].keys())
+        ids = [self.stations['names'][name].index for name in names]
+        self.baselines = OrderedDict([(f'{names[i]}-{names[j]}', self.pairs[ids[i]][ids[j]])
+                                      for i, j in combinations(range(len(names)), 2)])
+
+    # Station from name or code
+    def find_station(self, name):
+        if name in self.stations['names']:
+            return self.stations['names'][name]
+        if name in self.stations['codes']:
+            return self.stations['codes'][name]
+        if name.startswith('TIGO') and 'TIGO' in self.stations['names']:
+            return self.stations['names']['TIGO']
+        return None
+
+    # Remove stations (names or codes). Counts are updated using only the scans of removed stations.
+    # Scans left with one station are removed.
     def remove_stations(self, stations):
-        for name in stations:
-            sta_code = ''
-            if name in self.stations['names']:
-                sta_code = self.stations['names'][name]['code']
-            elif name.startswith('TIGO') and 'TIGO' in self.stations['names']:
-                sta_code = self.stations['names']['TIGO']['code']
-
-            if sta_code:
-                for scan_name in list(self.scans.keys()):
-                    sta_lst = self.scans[scan_name]['station_codes']
-                    if sta_code in sta_lst:
-                        sta_lst.pop(sta_code)
-                        if len(sta_lst) == 1:
-                            sta = list(sta_lst.keys())[0]
-                            self.stations['codes'][sta]['scans'].pop(scan_name)
-                            self.scans.pop(scan_name)
-                        self.stations['codes'][sta_code]['scans'].pop(scan_name)
-
-        self.count_observations()
+        for sta in filter(None, [self.find_station(name) for name in stations]):
+            for scan_name, scan in list(sta.scans.items()):
+                nbr_obs = len(scan) - 1
+                scan.remove(sta.index)
+                self.scheduled_obs -= nbr_obs
+                if src := self.sources.get(scan.source):
+                    src.scheduled_obs -= nbr_obs
+                for index in scan.ids:
+                    self.stations['codes'][self.codes[index]].scheduled_obs -= 1
+                    self.pairs[index][sta.index] = self.pairs[sta.index][index] = 0
+                if len(scan) < 2:
+                    for index in scan.ids:
+                        self.stations['codes'][self.codes[index]].scans.pop(scan_name)
+                    self.scans.pop(scan_name)
+                    if src:
+                        src.scans.pop(scan_name, None)
+            sta.scans.clear()
+            sta.scheduled_obs = 0
+            self.stations['removed'].append(sta.code)
+
+        self.make_baselines()
         return self.scheduled_obs
 
-    def make_observations(self):
-        observations = {}
-        for name, scan in self.scans.items():
-            stations = list(scan['station_codes'].keys())
-            for i in range(0, len(stations) - 1):
-                for j in range(i + 1, len(stations)):
-                    obs = SKD.init_obs(scan, stations[i], stations[j])
-                    observations['{}-{}-{}'.format(name, stations[i], stations[j])] = obs
-                    observations['{}-{}-{}'.format(name, stations[j], stations[i])] = obs
-
-        self.observations = observations
+    # Number of scans and observations if stations (codes) were removed. The schedule is not modified.
+    # Only scans of removed stations are visited.
+    def without(self, codes):
+        removed = {self.stations['codes'][code].index for code in codes if code in self.stations['codes']}
+        affected = {}
+        for index in removed:
+            affected.update(self.stations['codes'][self.codes[index]].scans)
+        nbr_scans, nbr_obs = len(self.scans), self.scheduled_obs
+        stations = {code: [len(sta.scans), sta.scheduled_obs] for code, sta in self.stations['codes'].items()
+                    if sta.index not in removed}
+        for scan in affected.values():
+            kept = [index for index in scan.ids if index not in removed]
+            size, left = len(scan), len(kept)
+            nbr_obs -= size * (size - 1) // 2 - left * (left - 1) // 2
+            nbr_scans -= 1 if left < 2 else 0
+            for index in kept:
+                sta = stations[self.codes[index]]
+                sta[0] -= 1 if left < 2 else 0
+                sta[1] -= size - left
+        return {'removed': sorted(self.codes[index] for index in removed), 'scans': nbr_scans,
+                'observations': nbr_obs, 'stations': {code: tuple(info) for code, info in stations.items()}}
+
+    # Evaluate many drop-out combinations on the same schedule. Results are the same as 'without'.
+    # Each combination is a list of station codes. All combinations of 'size' stations are used if none given.
+    # With numpy, stations left in every scan are computed for a block of combinations with one matrix product.
+    def dropouts(self, combos=None, size=1, block=256):
+        combos = [list(codes) for codes in (combos if combos is not None else
+                                            combinations(sorted(self.stations['codes']), size))]
+        if numpy is None or not self.scans:
+            return [self.without(codes) for codes in combos]
+        matrix, scan_sizes = self.incidence_matrix(list(self.scans.values()))
+        index = {code: sta.index for code, sta in self.stations['codes'].items()}
+        results = []
+        for first in range(0, len(combos), block):
+            group = combos[first:first + block]
+            removed = numpy.zeros((len(self.codes), len(group)))
+            for col, codes in enumerate(group):
+                removed[[index[code] for code in codes if code in index], col] = 1
+            kept = matrix @ (1 - removed)  # Stations left in each scan
+            valid = (kept >= 2) | (kept == scan_sizes[:, None])  # Scans kept in schedule
+            observations = (kept * (kept - 1) // 2).sum(axis=0)
+            sta_scans, sta_obs = matrix.T @ valid, matrix.T @ ((kept - 1) * valid)
+            for col, codes in enumerate(group):
+                out = removed[:, col] > 0
+                results.append({'removed': sorted(self.codes[i] for i in numpy.flatnonzero(out)),
+                                'scans': int(valid[:, col].sum()), 'observations': int(observations[col]),
+                                'stations': {self.codes[i]: (int(sta_scans[i, col]), int(sta_obs[i, col]))
+                                             for i in range(len(self.codes)) if not out[i]}})
+        return results
 
     def get_nbr_scans(self, id):
         return len(self.stations['codes'][id.capitalize()]['scans'])
@@ -311,8 +548,8 @@ class SKD:
         return self.stations['codes'][id.capitalize()]['scheduled_obs']
 
     def summary(self, rejected=None):
-        if rejected := [sta.capitalize() for sta in re.findall('..', rejected) if sta in self.stations["codes"]] \
-                if rejected else []:
+        codes = [sta.capitalize() for sta in re.findall('..', rejected)] if rejected else []
+        if rejected := [code for code in codes if code in self.stations['codes']]:
             self.remove_stations(rejected)
         print(f'Summary for {self.session_code}{" without " if rejected else ""}{" ".join(rejected)}')
         info = self.stations['codes']
@@ -323,20 +560,19 @@ class SKD:
 
     def list_scans(self, sta):
         sta = sta.capitalize()
-        for scan in self.data['station_codes'][sta]['scans']:
+        for scan in self.stations['codes'][sta].scans:
             print(scan)
 
     def list_observations(self, sta):
         sta = sta.capitalize()
 
         index = 0
-        for obs in self.data['obs_list']:
+        for obs in self.obs_list:
             if sta == obs['fr'] or sta == obs['to']:
                 fr, to, scan = obs['fr'], obs['to'], obs['scan']
-                duration = min(scan['station_codes'][fr]['duration'], scan['station_codes'][to]['duration'])
+                duration = min(scan.duration(fr), scan.duration(to))
                 index += 1
-                print(f'{index:5d} {scan["name"]:10} {scan["source"]:10} {scan["start"]} {fr} {to} {duration:4d}'
-                      f' {obs["X"]} {obs["S"]}')
+                print(f'{index:5d} {scan.name:10} {scan.source:10} {scan.start} {fr} {to} {duration:4d}')
 
     @staticmethod
     def init_sked():
@@ -350,25 +586,112 @@ class SKD:
         return {'sum': 0.0, 'n': 0, 'snr': {}, 'SEFD': {'measured': 0, 'predicted': 0, 'STATS': []}}
 
     @staticmethod
-    def init_sta(code='', name='', key=''):
-        return {'name': name, 'code': code, 'key': key, 'first_source': '', 'scans': OrderedDict(),
-                'scheduled': 0, 'scheduled_obs': 0, 'correlated': 0, 'used': 0, 'dropped': '', 'Dropped': '',
-                'X': SKD.init_band(8), 'S': SKD.init_band(6), 'antenna': {}}
+    def init_sta(code='', name='', key='', index=0):
+        return Station(index, code, name, key)
 
     @staticmethod
-    def init_src(code='', name=''):
-        name = code if name == '$' else name
-        return {'name': name, 'code': code, 'scheduled_obs': 0, 'scans': OrderedDict(), 'obs': {}}
+    def init_src(code='', name='', index=0):
+        return Source(index, code, name)
 
     @staticmethod
-    def init_scan(name, source, start):
-        return {'name': name, 'source': source, 'start': start, 'station_codes': {}}
+    def init_scan(name, source, start, codes=(), members=()):
+        members = sorted(members, key=lambda item: codes[item[0]])
+        return Scan(name, source, start, codes, [index for index, _ in members], [duration for _, duration in members])
 
     @staticmethod
     def init_obs(scan, fr, to):
         return {'scan': scan, 'fr': fr, 'to': to}
 
 
+# VEX file read in one pass at byte level to find where each $BLOCK starts. Statements of a block are decoded
+# only when the block is requested, so large blocks never used ($FREQ, $TRACKS...) are skipped.
+# Statements end with ';' and can span lines. Comments (*) and literal sections are ignored.
+class VEXFile:
+    find_blocks = re.compile(rb'^[ \t]*\$([A-Za-z0-9_]+)[ \t]*;', re.M).finditer
+    remove_comments = partial(re.compile(r'(^|;)[ \t]*\*[^\n]*', re.M).sub, r'\1')
+    remove_literals = partial(re.compile(r'start_literal\(.*?end_literal\([^)]*\)[ \t]*;', re.S).sub, '')
+    find_statements = re.compile(r'([^;]*);').finditer  # Text after last ';' is not a statement
+    chunk = 1024 * 1024
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        self.blocks, self.cache = {}, {}
+        start = name = None
+        for match in self.find_blocks(self.data):
+            if name:
+                self.blocks.setdefault(name, []).append((start, match.start()))
+            name, start = match[1].decode('utf-8', 'surrogateescape'), match.end()
+        if name:
+            self.blocks[name] = self.blocks.get(name, []) + [(start, len(self.data))]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    @property
+    def first_line(self):
+        return self.data[:self.data.find(b'\n')].decode('utf-8', 'surrogateescape')
+
+    # Statements of block with spaces around and new lines removed. Block is decoded by chunks ending at a new line.
+    # Text after the last ';' of a chunk is kept for the next one.
+    def statements(self, name):
+        for start, end in self.blocks.get(name, []):
+            rest = ''
+            while start < end:
+                stop = min(end, self.data.find(b'\n', start + self.chunk) + 1 or end)
+                # Keep literal section in same chunk
+                if (begin := self.data.rfind(b'start_literal', start, stop)) >= 0 \
+                        and self.data.find(b'end_literal', begin, stop) < 0:
+                    found = self.data.find(b'end_literal', begin, end)
+                    stop = end if found < 0 else min(end, self.data.find(b'\n', found) + 1 or end)
+                text = rest + self.data[start:stop].decode('utf-8', 'surrogateescape')
+                text = self.remove_comments(text) if '*' in text else text
+                text = self.remove_literals(text) if 'start_literal' in text else text
+                last = 0
+                for match in self.find_statements(text):
+                    if statement := match[1].strip():
+                        yield ' '.join(statement.split()) if '\n' in statement else statement
+                    last = match.end()
+                rest, start = text[last:], stop
+
+    # Records of def or scan definitions. Parameters are lists of values split on ':'
+    def records(self, name):
+        record = None
+        for statement in self.statements(name):
+            key, equal, value = statement.partition('=')
+            if not equal:
+                if statement.startswith('enddef') or statement.startswith('endscan'):
+                    if record:
+                        yield record
+                    record = None
+                elif statement.startswith('def ') or statement.startswith('scan '):
+                    record = {'code': statement.split()[1], 'ref': defaultdict(list)}
+            elif record is None:
+                continue
+            elif key.startswith('ref '):
+                record['ref'][key[3:].strip()[1:]].append(value.strip())
+            else:
+                record.setdefault(key.strip(), []).append(value.strip().split(':'))
+
+    # Block as dictionary of records. GLOBAL block has only references.
+    def block(self, name):
+        if name not in self.cache:
+            if name == 'GLOBAL':
+                self.cache[name] = {key.strip()[1:]: value.strip() for key, _, value in
+                                    [statement[3:].partition('=') for statement in self.statements(name)
+                                     if statement.startswith('ref ')]}
+            else:
+                self.cache[name] = {record['code']: record for record in self.records(name)}
+        return self.cache[name]
+
+
 class VEX(SKD):
 
     def __init__(self, path):
@@ -380,40 +703,16 @@ class VEX(SKD):
 
     def read(self, VieSched_sort=False):
 
-        blocks = defaultdict(dict)
-        block, literal = '', False
-
-        if not self.has_next() or not self.line.strip().startswith('VEX_rev'):
-            print(f'{self.path} not a VEX file! Check first line.')
-            return
-
-        while self.has_next():
-            for part in self.line.strip().split(';'):
-                if not (part := part.strip()) or part.startswith('*'):
-                    continue
-                if part.startswith('end_literal'):
-                    literal = False
-                elif literal:
-                    continue
-                elif part.startswith('start_literal'):
-                    literal = True
-                elif part.startswith('$'):
-                    block = part[1:]
-                elif part.startswith('enddef') or part.startswith('endscan'):
-                    blocks[block][record['code']] = record
-                elif part.startswith('def ') or part.startswith('scan '):
-                    record = {'code': part.split()[1], 'ref': defaultdict(list)}
-                elif part.startswith('ref '):
-                    key = (info := part[3:].split('='))[0].strip()[1:]
-                    if block == 'GLOBAL':
-                        blocks[block][key] = info[1].strip()
-                    else:
-                        record['ref'][key].append(info[1].strip())
-                elif '=' in part:
-                    if (key := (info := part.split('='))[0].strip()) not in record:
-                        record[key] = []
-                    record[key].append(info[1].strip().split(':'))
+        with VEXFile(self.path) as vex:
+            if not vex.first_line.strip().startswith('VEX_rev'):
+                logger.warning(f'{self.path} not a VEX file! Check first line.')
+                self.errors.append('Not a VEX file')
+                self.valid = False
+                return
+            self.decode_blocks(vex)
 
+    def decode_blocks(self, vex):
+        blocks = {name: vex.block(name) for name in ['EXPER', 'STATION', 'SITE', 'SOURCE']}
         # Keep EXPER information
         for code, record in blocks['EXPER'].items():
             if 'exper_name' in record:
@@ -427,64 +726,311 @@ class VEX(SKD):
             if name in sites:
                 site = sites[name]
                 code, name = self.decode(site['site_ID']), self.decode(site.get('site_name', name))
-            sta = SKD.init_sta(code, name)
-            self.stations['codes'][code] = self.stations['names'][name] = sta
+            self.add_station(code, name)
 
         # Keep source information
         for record in blocks['SOURCE'].values():
-            name, code = self.decode(record['source_name']), record['code']
-            self.sources[name] = SKD.init_src(code, name)
-        # Keep scans self.data
-        for record in blocks['SCHED'].values():
+            self.add_source(record['code'], self.decode(record['source_name']))
+        # Keep scans self.data. Scans are decoded one at a time
+        start = None
+        for record in vex.records('SCHED'):
             code = self.decode(record['source'])
             source = self.decode(blocks['SOURCE'][code]['source_name'])
             start = utc(vex=self.decode(record['start']))
             self.start = self.start if self.start else start
 
-            name = record['code'].lower()
-            scan = {'name': name, 'source': source, 'start': start, 'station_codes': {}}
-            self.sources[source]['scans'][name] = self.scans[name] = scan
-            nbr_obs = len(record['station']) - 1
-            self.scheduled_obs += int((nbr_obs * (nbr_obs + 1)) / 2)
+            members = []
             for info in record['station']:
                 code = info[0].strip().capitalize()
-                start_rec, stop_rec = int(info[1].split()[0].strip()), int(info[2].split()[0].strip())
-                scan['station_codes'][code] = {'duration': stop_rec - start_rec}
-                sta = self.stations['codes'][code]
-                sta['scans'][name] = scan
-                sta['scheduled_obs'] += nbr_obs
-
-            scan['station_codes'] = dict(sorted(scan['station_codes'].items()))
-            src = self.sources[source]
-
-            for fr in scan['station_codes']:
-                if fr not in src:
-                    src[fr] = {}
-                for to in scan['station_codes']:
-                    if fr != to:
-                        if to not in src[fr]:
-                            src[fr][to] = []
-                        src[fr][to].append(scan)
-
-            if source not in self.observations:
-                self.observations[source] = {}
-            src = self.observations[source]
-            for fr in scan['station_codes']:
-                if fr not in src:
-                    src[fr] = {}
-                for to in scan['station_codes']:
-                    if fr < to:
-                        if to not in src[fr]:
-                            src[fr][to] = []
-                        obs = SKD.init_obs(scan, fr, to)
-                        src[fr][to].append(obs)
-                        self.obs_list.append(obs)
+                start_rec, stop_rec = int(info[1].split()[0]), int(info[2].split()[0])
+                members.append((self.stations['codes'][code].index, stop_rec - start_rec))
+            self.insert_scan(record['code'].lower(), source, start, members)
 
         self.end = self.end if self.end else start
         self.set_first_sources()
         self.count_observations()
 
+
+# Cache of parsed schedules in scratch folder. Entries are named using the hash of schedule path, size,
+# modified time, content and parser version, so a changed file or parser never uses an old entry.
+class ScheduleCache:
+
+    def __init__(self, size=50):
+        self.size = size  # Maximum number of entries
+        self.hits = self.misses = 0
+
+    @property
+    def folder(self):
+        return Path(settings.Folders.scratch, 'schedules')
+
+    @property
+    def enabled(self):
+        return hasattr(settings, 'Folders') and hasattr(settings.Folders, 'scratch')
+
+    @staticmethod
+    def key(path, sort=False):
+        try:
+            stat, md5 = os.stat(path), hashlib.md5()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(chunk)
+        except OSError:
+            return ''
+        text = '-'.join(map(str, [Path(path).resolve(), stat.st_size, stat.st_mtime_ns, md5.hexdigest(),
+                                  PARSER_VERSION, sort]))
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+    # Return dump of parsed schedule or None if not in cache
+    def get(self, key):
+        entry = Path(self.folder, f'{key}.json')
+        try:
+            with open(entry) as f:
+                data = json.load(f)
+            os.utime(entry)  # Keep most recently used entries
+            self.hits += 1
+            return data
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+    # Save dump of parsed schedule and remove least recently used entries
+    def put(self, key, data):
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            tmp, entry = Path(self.folder, f'{key}.tmp'), Path(self.folder, f'{key}.json')
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, entry)
+            entries = sorted(self.folder.glob('*.json'), key=lambda path: path.stat().st_mtime, reverse=True)
+            for path in entries[self.size:]:
+                path.unlink(missing_ok=True)
+        except OSError as exc:
+            logger.warning(f'schedule cache: {str(exc)}')
+
+
+cache = ScheduleCache()
+
+
+# Read skd or vex file. Parsed schedule is taken from cache when file has not changed.
+def read_schedule(path, VieSched_sort=False):
+    cls = VEX if Path(path).suffix == '.vex' else SKD
+    if key := cache.key(path, VieSched_sort) if cache.enabled else '':
+        if data := cache.get(key):
+            return cls.load(path, data)
+    with cls(path) as skd:
+        skd.read(VieSched_sort)
+    if key and skd.valid and not skd.errors:
+        cache.put(key, skd.dump())
+    return skd
+
+
+
+# Differences between two versions of a schedule. Scans are matched on (start, source) using dictionaries so that
+# comparison is linear with number of scans. Scans not matched are paired as retimed when a scan of the same source
+# is within tolerance (seconds). Station changes are listed by station code using scan names of the new version.
+def diff_schedules(old, new, tolerance=3600):
+    old_scans = {(scan.start, scan.source): scan for scan in old.scans.values()}
+    new_scans = {(scan.start, scan.source): scan for scan in new.scans.values()}
+    matched = [(scan, new_scans[key]) for key, scan in old_scans.items() if key in new_scans]
+    removed, added = defaultdict(list), defaultdict(list)
+    for key, scan in old_scans.items():
+        if key not in new_scans:
+            removed[scan.source].append(scan)
+    for key, scan in new_scans.items():
+        if key not in old_scans:
+            added[scan.source].append(scan)
+    # Pair unmatched scans of same source in chronological order
+    retimed = []
+    for source in set(removed).intersection(added):
+        olds, news, kept_old, kept_new, i, j = removed[source], added[source], [], [], 0, 0
+        while i < len(olds) and j < len(news):
+            if abs(seconds := (news[j].start - olds[i].start).total_seconds()) <= tolerance:
+                retimed.append((olds[i], news[j]))
+                i, j = i + 1, j + 1
+            elif seconds < 0:
+                kept_new.append(news[j])
+                j += 1
+            else:
+                kept_old.append(olds[i])
+                i += 1
+        removed[source], added[source] = kept_old + olds[i:], kept_new + news[j:]
+
+    stations = defaultdict(lambda: {'added': [], 'removed': [], 'retimed': [], 'duration': []})
+    for scan in [scan for scans in removed.values() for scan in scans]:
+        for code, _ in scan.members():
+            stations[code]['removed'].append((scan.start, scan.name))
+    for scan in [scan for scans in added.values() for scan in scans]:
+        for code, _ in scan.members():
+            stations[code]['added'].append((scan.start, scan.name))
+    same_ids, unchanged = old.codes == new.codes, 0
+    for old_scan, new_scan in matched + retimed:
+        # Station ids are the same in both versions when station list has not changed
+        if same_ids and old_scan.ids == new_scan.ids and old_scan.durations == new_scan.durations:
+            if old_scan.start == new_scan.start:
+                unchanged += 1
+                continue
+        old_members, new_members = dict(old_scan.members()), dict(new_scan.members())
+        if old_scan.start == new_scan.start and old_members == new_members:
+            unchanged += 1
+            continue
+        item = (new_scan.start, new_scan.name)
+        for code, duration in new_members.items():
+            if code not in old_members:
+                stations[code]['added'].append(item)
+            elif old_scan.start != new_scan.start:
+                stations[code]['retimed'].append(item)
+            elif duration != old_members[code]:
+                stations[code]['duration'].append(item)
+        for code in old_members.keys() - new_members.keys():
+            stations[code]['removed'].append((old_scan.start, old_scan.name))
+
+    def names(scans):
+        return [scan.name for scan in sorted([scan for items in scans.values() for scan in items],
+                                             key=lambda scan: scan.start)]
+
+    return {'session': new.session_code, 'added': names(added), 'removed': names(removed),
+            'retimed': [(old_scan.name, new_scan.name, int((new_scan.start - old_scan.start).total_seconds()))
+                        for old_scan, new_scan in sorted(retimed, key=lambda pair: pair[1].start)],
+            'unchanged': unchanged,
+            'new_stations': [code for code in new.codes if code not in old.codes],
+            'dropped_stations': [code for code in old.codes if code not in new.codes],
+            'stations': {code: {key: [name for _, name in sorted(items)] for key, items in changes.items() if items}
+                         for code, changes in sorted(stations.items())}}
+
+
+# Text lines describing differences for all stations or only one. At most max_names scan names are listed.
+def diff_text(diff, sta_id=None, max_names=10):
+    def listed(text, items):
+        more = f' and {len(items) - max_names} more' if len(items) > max_names else ''
+        return f'{text}: {" ".join(items[:max_names])}{more}'
+
+    lines = [f'{len(diff["added"])} scans added, {len(diff["removed"])} removed, {len(diff["retimed"])} retimed, '
+             f'{diff["unchanged"]} unchanged']
+    if diff['new_stations']:
+        lines.append(f'New stations: {" ".join(diff["new_stations"])}')
+    if diff['dropped_stations']:
+        lines.append(f'Dropped stations: {" ".join(diff["dropped_stations"])}')
+    codes = [sta_id.capitalize()] if sta_id else list(diff['stations'])
+    for code in codes:
+        if changes := diff['stations'].get(code):
+            lines.extend([listed(f'{code} {key}', items) for key, items in changes.items()])
+        elif sta_id:
+            lines.append(f'{code}: no change')
+    return lines
+
+
+# Path of skd or vex file of session in schedule folder. None if not available
+def find_schedule(ses_id):
+    if not (folder := getattr(settings.Folders, 'schedule', None) if hasattr(settings, 'Folders') else None):
+        return None
+    for path in [Path(folder, f'{ses_id.lower()}{ext}') for ext in ('.skd', '.vex')]:
+        if path.exists():
+            return path
+    return None
+
+
+_SUMMARY_TIMES = ('updated', 'start', 'end')
+
+
+def _convert_times(summary, convert):
+    for record in [summary] + summary['scheduled']:
+        for key in _SUMMARY_TIMES:
+            if record.get(key) is not None:
+                record[key] = convert(record[key])
+    return summary
+
+
+# Summary with same fields as VCC schedule summary (select=summary) made from parsed schedule.
+# Timeline of each station is a list of [seconds from session start, duration] so that it stays compact in json.
+def make_summary(skd, updated=None):
+    timelines = [[] for _ in skd.codes]
+    for scan in skd.scans.values():
+        offset = int((scan.start - skd.start).total_seconds())
+        for index, duration in zip(scan.ids, scan.durations):
+            timelines[index].append([offset, duration])
+    scheduled = []
+    for sta in skd.stations['codes'].values():
+        timeline = sorted(timelines[sta.index])
+        start = skd.start + timedelta(seconds=timeline[0][0]) if timeline else None
+        end = skd.start + timedelta(seconds=max([sum(item) for item in timeline])) if timeline else None
+        scheduled.append({'station': sta.code, 'name': sta.name, 'version': 0, 'nbr_scans': len(sta.scans),
+                          'nbr_obs': sta.scheduled_obs, 'first_source': sta.first_source, 'start': start, 'end': end,
+                          'timeline': timeline})
+    return {'session': skd.session_code, 'version': 0, 'updated': updated, 'local': True, 'start': skd.start,
+            'end': skd.end, 'nbr_scans': len(skd.scans), 'nbr_obs': skd.scheduled_obs,
+            'observing': [info['station'] for info in scheduled if info['nbr_scans']], 'scheduled': scheduled}
+
+
+# Summary of local schedule file. Summary is kept in schedule cache as compact json.
+def local_summary(path):
+    if key := cache.key(path) if cache.enabled else '':
+        if data := cache.get(f'{key}-summary'):
+            return _convert_times(data, datetime.fromisoformat)
+    summary = make_summary(skd := read_schedule(path), datetime.utcfromtimestamp(os.stat(path).st_mtime))
+    if key and skd.valid and not skd.errors:
+        cache.put(f'{key}-summary', _convert_times(summary, datetime.isoformat))
+        summary = _convert_times(summary, datetime.fromisoformat)
+    return summary
+
+
+# Compact summary of schedule {station: (scans, observations, duration)} used by batch processing.
+# Workers return only these small values instead of the parsed schedule.
+def summarize(path):
+    try:
+        skd = read_schedule(path)
+    except Exception as exc:
+        return {'path': str(path), 'error': str(exc)}
+    if not skd.valid or not skd.codes:
+        return {'path': str(path), 'error': 'no schedule information'}
+    durations = [0] * len(skd.codes)
+    for scan in skd.scans.values():
+        for index, duration in zip(scan.ids, scan.durations):
+            durations[index] += duration
+    stations = {sta.code: (len(sta.scans), sta.scheduled_obs, durations[sta.index])
+                for sta in skd.stations['codes'].values()}
+    return {'path': str(path), 'session': skd.session_code or Path(path).stem, 'start': skd.start, 'end': skd.end,
+            'scans': len(skd.scans), 'observations': skd.scheduled_obs, 'stations': stations}
+
+
+# Schedule files in folder (recursive) or matching glob pattern. Files in hidden folders (previous versions)
+# are skipped. Only one file per session is used when skd and vex files are in the same folder (skd first,
+# as in find_schedule).
+def find_schedules(pattern):
+    import glob
+
+    if Path(pattern).is_dir():
+        paths = Path(pattern).rglob('*')
+    else:
+        paths = map(Path, glob.glob(pattern, recursive=True))
+    schedules = {}
+    for path in sorted(paths, key=lambda path: path.suffix != '.skd'):
+        if path.suffix in ('.skd', '.vex') and path.is_file() \
+                and not any(part.startswith('.') and part != '..' for part in path.parent.parts):
+            schedules.setdefault((path.parent, path.stem.lower()), path)
+    return sorted(schedules.values())
+
+
+# Summaries of schedules parsed in a pool of processes. Files are sent by chunks to limit communication overhead.
+def batch(paths, jobs=None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    paths = list(paths)
+    if (jobs := max(1, min(jobs or os.cpu_count() or 1, len(paths)))) == 1:
+        yield from map(summarize, paths)
         return
+    with ProcessPoolExecutor(jobs) as pool:
+        yield from pool.map(summarize, paths, chunksize=max(1, len(paths) // (jobs * 4)))
+
+
+# Merge summaries in table of (station, session, scans, observations, duration) sorted by station and session.
+# A session found in more than one file is counted once.
+def merge_summaries(summaries):
+    sessions = {}
+    for info in summaries:
+        if 'stations' in info:
+            sessions.setdefault(info['session'].lower(), info)
+    return sorted([(code, info['session'], *values) for info in sessions.values()
+                   for code, values in info['stations'].items()])
 
 
 if __name__ == '__main__':
@@ -497,22 +1043,101 @@ if __name__ == '__main__':
     def main():
 
         parser = argparse.ArgumentParser(description='Edit Station downtime')
-        parser.add_argument('path')
+        parser.add_argument('-c', '--config', help='config file (schedule cache in scratch folder)', required=False)
+        parser.add_argument('-b', '--benchmark', help='time and memory used to read schedule', action='store_true')
+        parser.add_argument('-r', '--reject', help='summary without these stations (codes)', required=False)
+        parser.add_argument('-w', '--what-if', help='observations lost when N stations drop out', type=int, default=0)
+        parser.add_argument('-t', '--time-decoders', help='benchmark time decoders', action='store_true')
+        parser.add_argument('-d', '--diff', help='changes from this older version of schedule', required=False)
+        parser.add_argument('-s', '--station', help='station code for changes', required=False)
+        parser.add_argument('-S', '--summary', help='summary of schedule as compact json', action='store_true')
+        parser.add_argument('-j', '--jobs', help='processes used for folder or glob pattern', type=int, default=0)
+        parser.add_argument('path', nargs='?', help='schedule file, folder or glob pattern of schedules')
 
         args = parser.parse_args()
+        if args.config:
+            settings.init(args)
+        if args.time_decoders:
+            benchmark_utc()
+            return
+        if not args.path:
+            parser.error('path is required')
+
+        if Path(args.path).is_dir() or any(char in args.path for char in '*?['):
+            import time
+
+            t0 = time.perf_counter()
+            summaries = list(batch(paths := find_schedules(args.path), args.jobs))
+            elapsed = time.perf_counter() - t0
+            print(f'{"station":8s} {"session":12s} {"scans":>6s} {"obs":>8s} {"hours":>8s}')
+            totals = defaultdict(lambda: [0, 0, 0, 0])
+            for code, session, scans, obs, duration in merge_summaries(summaries):
+                print(f'{code:8s} {session:12s} {scans:6d} {obs:8d} {duration / 3600:8.2f}')
+                totals[code] = [total + value for total, value in zip(totals[code], (1, scans, obs, duration))]
+            for code, (sessions, scans, obs, duration) in sorted(totals.items()):
+                print(f'{code:8s} {f"{sessions} sessions":12s} {scans:6d} {obs:8d} {duration / 3600:8.2f}')
+            for info in summaries:
+                if 'error' in info:
+                    print(f'{info["path"]} {info["error"]}')
+            print(f'{len(paths)} schedules read in {elapsed:.3f} seconds')
+            return
 
         if not (path := Path(args.path)).exists():
             print(f"{path.name} does not exist")
             exit(1)
         cls = VEX if path.suffix == '.vex' else SKD
-        with cls(args.path) as skd:
-            skd.read()
-            print(skd.scheduling_software, skd.session_code, skd.correlator)
-            print(skd.start, skd.end)
-            for code, info in skd.stations['codes'].items():
-                print(code, len(info['scans']))
-                for name, data in info['scans'].items():
-                    print(name, data['start'], data['start'] + timedelta(seconds=data['station_codes'][code]['duration']))
+        if args.benchmark:
+            import time
+            import tracemalloc
+
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            with cls(args.path) as skd:
+                skd.read()
+            elapsed, (size, peak) = time.perf_counter() - t0, tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'{path.name} {len(skd.stations["codes"])} stations {len(skd.scans)} scans '
+                  f'{skd.scheduled_obs} observations')
+            print(f'read in {elapsed:.3f} seconds using {size / 1000000:.1f} MB (peak {peak / 1000000:.1f} MB)')
+            counters = [('numpy', skd.incidence_counts), ('python', lambda: skd.loop_counts(list(skd.scans.values())))]
+            for name, count in counters:
+                if name == 'python' or numpy is not None:
+                    t0 = time.perf_counter()
+                    count()
+                    print(f'observations counted in {1000 * (time.perf_counter() - t0):.1f} ms ({name})')
+            if cache.enabled:
+                key = cache.key(path)
+                cache.put(key, skd.dump())
+                t0 = time.perf_counter()
+                cls.load(path, cache.get(key))
+                print(f'read from cache in {1000 * (time.perf_counter() - t0):.1f} ms')
+            return
+        if args.summary:
+            print(json.dumps(_convert_times(local_summary(path), datetime.isoformat), separators=(',', ':')))
+            return
+        if args.diff:
+            diff = diff_schedules(read_schedule(args.diff), read_schedule(path))
+            print('\n'.join(diff_text(diff, args.station)))
+            return
+        if args.reject is not None or args.what_if:
+            skd = read_schedule(path)
+            if args.what_if:
+                results = sorted(skd.dropouts(size=args.what_if), key=itemgetter('observations'))
+                print(f'Worst drop-outs of {args.what_if} stations for {skd.session_code}')
+                for result in results[:10]:
+                    print(f'{" ".join(result["removed"])} {result["scans"]:5d} scans '
+                          f'{result["observations"]:7d} observations '
+                          f'({100 * result["observations"] / max(skd.scheduled_obs, 1):.1f}%)')
+            if args.reject is not None:
+                skd.summary(args.reject)
+            return
+        skd = read_schedule(path)
+        print(skd.scheduling_software, skd.session_code, skd.correlator)
+        print(skd.start, skd.end)
+        for code, info in skd.stations['codes'].items():
+            print(code, len(info['scans']))
+            for name, data in info['scans'].items():
+                print(name, data['start'], data['start'] + timedelta(seconds=data['station_codes'][code]['duration']))
 
 
     sys.exit(main())
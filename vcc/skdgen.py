@@ -0,0 +1,170 @@
+import sys
+import random
+from datetime import datetime, timedelta
+from itertools import product
+from string import ascii_uppercase, ascii_lowercase
+from pathlib import Path
+
+"""
+Generate synthetic sked schedules (.skd) for benchmarks of SKD parsing, counting and station removal.
+Scans have random sources, subsets of stations and durations. The same seed always gives the same schedule.
+The same schedule can be written as VEX with long $FREQ, $BBC, $IF and $TRACKS blocks like correlator files.
+"""
+
+NAMES = ['GGAO12M', 'WESTFORD', 'KOKEE12M', 'MACGO12M', 'NYALE13S', 'WETTZ13S', 'YEBES40M', 'HOBART12', 'KATH12M',
+         'YARRA12M', 'HART15M', 'NYALES20', 'SESHAN25', 'ISHIOKA', 'AGGO', 'ONSA13NE', 'ONSA13SW', 'ONSALA60',
+         'MATERA', 'NOTO', 'MEDICINA', 'KOKEE', 'WARK12M', 'SVETLOE']
+CODES = ['Gs', 'Wf', 'K2', 'Mg', 'Ny', 'Wz', 'Ys', 'Hb', 'Ke', 'Yg', 'Ht', 'Ns', 'Sh', 'Is', 'Ag', 'Ow', 'Oe',
+         'On', 'Ma', 'Nt', 'Mc', 'Kk', 'Ww', 'Sv']
+
+
+# Station (key, name, code). Extra stations get made up names and codes
+def stations(nbr):
+    keys = [c for c in ascii_uppercase + ascii_lowercase + '0123456789']
+    codes = CODES + [a + b for a, b in product(ascii_uppercase, ascii_lowercase) if a + b not in CODES]
+    names = NAMES + [f'STAT{i:04d}' for i in range(len(NAMES), nbr)]
+    return list(zip(keys, names, codes))[:nbr]
+
+
+def sources(nbr, rnd):
+    return [f'{rnd.randint(0, 2359):04d}{rnd.choice("+-")}{rnd.randint(0, 899):03d}' for _ in range(nbr)]
+
+
+class SKDGenerator:
+    def __init__(self, ses_id, nbr_stations, start, duration, seed=0, nbr_sources=200, per_scan=(2, 8)):
+        self.ses_id, self.start, self.duration = ses_id.lower(), start, int(duration)
+        self.random = random.Random(f'{seed}-{self.ses_id}')
+        self.stations = stations(nbr_stations)
+        self.sources = sorted(set(sources(nbr_sources, self.random)))
+        self.per_scan = (min(per_scan[0], nbr_stations), min(per_scan[1], nbr_stations))
+
+    @property
+    def name(self):
+        return f'{self.ses_id}.skd'
+
+    @property
+    def vex_name(self):
+        return f'{self.ses_id}.vex'
+
+    def header(self, end):
+        lines = [f'$EXPER {self.ses_id.upper()}', '$PARAM',
+                 'SCHEDULING_SOFTWARE SKED',
+                 f'SCHEDULER  NASA  CORRELATOR  WASH  START  {self.start:%Y%j%H%M%S}  END  {end:%Y%j%H%M%S}',
+                 '$SOURCES']
+        lines.extend([f'{name} $ 00 00 00.0000000 +00 00 00.000000 2000.0 0.0' for name in self.sources])
+        lines.append('$STATIONS')
+        for key, name, code in self.stations:
+            lines.append(f'A {key} {name:8s} AZEL 0.0000 120.0 0 270.0 810.0 60.0 0 5.0 85.0 0.0 {code} 12.0 1')
+        return lines
+
+    # Source, start, station members and durations of each scan in chronological order
+    def schedule(self):
+        rnd, start, end = self.random, self.start, self.start + timedelta(seconds=self.duration)
+        while start < end:
+            source, nbr = rnd.choice(self.sources), rnd.randint(*self.per_scan)
+            members = sorted(rnd.sample(self.stations, nbr))
+            yield source, start, members, [rnd.randint(30, 300) for _ in members]
+            start += timedelta(seconds=rnd.randint(30, 120))
+
+    # Lines of $SKED section in chronological order
+    def scans(self):
+        for source, start, members, durations in self.schedule():
+            keys = ''.join([f'{key}-' for key, _, _ in members])
+            footage = ' '.join(['1F000000'] * len(members))
+            yield f'{source} 10 SX PREOB {start:%y%j%H%M%S} {max(durations)} MIDOB 0 POSTOB {keys} {footage} ' \
+                  f'YYNYNNN {" ".join(map(str, durations))}'
+
+    # Blocks not used by schedule readers. One definition per station, like correlator VEX files.
+    def vex_setup(self, channels=64):
+        lines = ['$FREQ;']
+        for _, _, code in self.stations:
+            lines.extend([f'def FREQ_{code};', '* setup for station', '    sample_rate = 64.000 Ms/sec;'])
+            for i in range(channels):
+                lines.append(f'    chan_def = &X : {8200 + i * 16:.2f} MHz : U : 16.00 MHz : &CH{i + 1:02d} '
+                             f': &BBC{i % 16 + 1:02d}\n        : &L_cal;  * {i}')
+            lines.append('enddef;')
+        lines.append('$BBC;')
+        for _, _, code in self.stations:
+            lines.append(f'def BBC_{code};')
+            lines.extend([f'    BBC_assign = &BBC{i + 1:02d} : {i + 1} : &IF_A;' for i in range(16)])
+            lines.append('enddef;')
+        lines.append('$IF;')
+        for _, _, code in self.stations:
+            lines.extend([f'def IF_{code};', '    if_def = &IF_A : A : R : 7600.00 MHz : U : 1 MHz : 0 Hz;',
+                          'enddef;'])
+        lines.append('$TRACKS;')
+        for _, _, code in self.stations:
+            lines.extend([f'def TRACKS_{code};', '    track_frame_format = VDIF;'])
+            lines.extend([f'    fanout_def = : &CH{i % channels + 1:02d} : sign : 1 : {i + 2};'
+                          for i in range(2 * channels)])
+            lines.append('enddef;')
+        return lines
+
+    def vex_lines(self):
+        yield from ['VEX_rev = 1.5;', '*    synthetic schedule', '$GLOBAL;', f'    ref $EXPER = {self.ses_id};',
+                    '$EXPER;', f'def {self.ses_id};', f'    exper_name = {self.ses_id};',
+                    '    exper_description = "synthetic";', '    target_correlator = WASH;', 'enddef;',
+                    '$MODE;', 'def GEOSX;']
+        yield from [f'    ref $FREQ = FREQ_{code}:{code};' for _, _, code in self.stations]
+        yield from ['enddef;', '$STATION;']
+        for _, name, code in self.stations:
+            yield from [f'def {code};', f'    ref $SITE = {name};', 'enddef;']
+        yield '$SITE;'
+        for _, name, code in self.stations:
+            yield from [f'def {name};', '    site_type = fixed;', f'    site_name = {name};',
+                        f'    site_ID = {code};', '    site_position = 0.0 m : 0.0 m : 0.0 m;', 'enddef;']
+        yield '$SOURCE;'
+        for name in self.sources:
+            yield from [f'def {name};', f'    source_name = {name};', '    ra = 00h00m00.0s;   dec = 00d00\'00.0";',
+                        '    ref_coord_frame = J2000;', 'enddef;']
+        yield from self.vex_setup()
+        yield from ['$SCHED;', 'start_literal(notes);', 'scan with ; in literal text', 'end_literal(notes);']
+        for number, (source, start, members, durations) in enumerate(self.schedule(), 1):
+            yield f'scan No{number:04d};'
+            yield f'    start = {start:%Yy%jd%Hh%Mm%Ss}; mode = GEOSX; source = {source};'
+            for (_, _, code), duration in zip(members, durations):
+                yield f'    station = {code} :    0 sec : {duration:4d} sec :      0.000 GB :    : &ccw : 1;'
+            yield 'endscan;'
+
+    def write_vex(self, folder):
+        path = Path(folder, self.vex_name)
+        with open(path, 'w', buffering=1024 * 1024) as f:
+            for line in self.vex_lines():
+                f.write(line + '\n')
+        return path
+
+    def write(self, folder):
+        path = Path(folder, self.name)
+        with open(path, 'w', buffering=1024 * 1024) as f:
+            f.write('\n'.join(self.header(self.start + timedelta(seconds=self.duration))) + '\n$SKED\n')
+            for line in self.scans():
+                f.write(line + '\n')
+        return path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate synthetic sked schedules', prog='skdgen')
+    parser.add_argument('-o', '--output', help='output folder', default='.')
+    parser.add_argument('-d', '--duration', help='duration of session in hours', type=float, default=24)
+    parser.add_argument('-n', '--stations', help='number of stations', type=int, default=20)
+    parser.add_argument('-S', '--start', help='start time (yyyy-mm-dd hh:mm)', default='2024-04-10 17:30')
+    parser.add_argument('-m', '--max', help='maximum number of stations per scan', type=int, default=8)
+    parser.add_argument('-s', '--seed', help='random seed', type=int, default=0)
+    parser.add_argument('-x', '--vex', help='write VEX file', action='store_true')
+    parser.add_argument('session', help='session code', nargs='?', default='r4999')
+
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d %H:%M')
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    gen = SKDGenerator(args.session, args.stations, start, args.duration * 3600, seed=args.seed,
+                       per_scan=(2, args.max))
+    path = gen.write_vex(args.output) if args.vex else gen.write(args.output)
+    print(f'{path} {path.stat().st_size / 1000000:.1f} MB')
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from vcc import json_encoder, json_decoder
+
+
+# Append-only store of messages. Each line is a [header, data] json record.
+# A small index keeps the offset of the first record of each day. It is used to find where a reader should start
+# and to remove records older than max_age days without decoding them. Compaction is done at most once a day.
+# Writers from different processes are serialized by a lock file (the store itself is replaced by compaction).
+class MessageStore:
+    def __init__(self, path, max_age=5, legacy=None):
+        self.path, self.legacy = Path(path), Path(legacy) if legacy else None
+        self.index_path, self.lock_path = self.path.with_suffix('.idx'), self.path.with_suffix('.lock')
+        self.max_age = timedelta(days=max_age)
+        self.inode, self.offset = 0, 0  # Position of reader
+
+    # Exclusive lock for append and compaction
+    @contextmanager
+    def locked(self):
+        with open(self.lock_path, 'a') as f:
+            if f.tell() == 0:
+                try:
+                    self.lock_path.chmod(0o664)
+                except OSError:
+                    pass
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'inode': 0, 'days': {}}
+
+    def save_index(self, index):
+        tmp = Path(f'{self.index_path}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+        self.index_path.chmod(0o664)
+
+    @staticmethod
+    def decode(line):
+        try:
+            header, data = json_decoder(json.loads(line))
+            return header, data
+        except (ValueError, TypeError):
+            return None, None
+
+    # Scan store to make index. Only needed if index is missing or not for this file
+    def make_index(self):
+        index, offset = {'inode': self.path.stat().st_ino, 'days': {}}, 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if (header := self.decode(line)[0]) and (day := header['utc'].date().isoformat()) not in index['days']:
+                    index['days'][day] = offset
+                offset += len(line)
+        self.save_index(index)
+        return index
+
+    # Move records of old ns.json file into store. Called with lock held.
+    def migrate(self):
+        try:
+            with open(self.legacy) as f:
+                records = json_decoder(json.loads(text)) if (text := f.read()) else []
+            with open(self.path, 'a') as f:
+                for header, data in records:
+                    f.write(json.dumps((header, data), default=json_encoder) + '\n')
+            self.legacy.unlink()
+        except (OSError, ValueError):
+            pass
+
+    def append(self, header, data):
+        with self.locked():
+            if self.legacy and self.legacy.exists():
+                self.migrate()
+            header = json_decoder(header)
+            with open(self.path, 'a') as f:
+                offset = f.tell()
+                f.write(json.dumps((header, data), default=json_encoder) + '\n')
+                inode = os.fstat(f.fileno()).st_ino
+            if offset == 0:
+                self.path.chmod(0o664)
+            if (index := self.load_index())['inode'] != inode:
+                index = self.make_index()
+            elif (day := header['utc'].date().isoformat()) not in index['days']:
+                index['days'][day] = offset
+                self.save_index(index)
+            self.compact(index)
+
+    # Remove records older than max_age by copying recent records to new file. Called with lock held.
+    def compact(self, index):
+        too_old = datetime.utcnow() - self.max_age
+        if not (days := sorted(index['days'])) or days[0] >= (too_old - timedelta(days=1)).date().isoformat():
+            return
+        keep = [day for day in days if day >= too_old.date().isoformat()]
+        new_index = {'inode': 0, 'days': {}}
+        tmp = Path(f'{self.path}.tmp')
+        with open(self.path, 'rb') as f, open(tmp, 'wb') as out:
+            if keep:
+                f.seek(index['days'][keep[0]])
+                for line in f:
+                    if (header := self.decode(line)[0]) and header['utc'] > too_old:
+                        if (day := header['utc'].date().isoformat()) not in new_index['days']:
+                            new_index['days'][day] = out.tell()
+                        out.write(line)
+            new_index['inode'] = os.fstat(out.fileno()).st_ino
+        tmp.chmod(0o664)
+        os.replace(tmp, self.path)
+        self.save_index(new_index)
+
+    # Migrate old file when store is read before any new record is appended
+    def check_legacy(self):
+        if self.legacy and self.legacy.exists():
+            try:
+                with self.locked():
+                    if self.legacy.exists():
+                        self.migrate()
+            except OSError:
+                pass
+
+    # Return records appended since last call. First call (or after compaction) starts at the day of 'since'.
+    def read_new(self, since=None):
+        self.check_legacy()
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return []
+        if stat.st_ino == self.inode and stat.st_size == self.offset:
+            return []
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode, self.offset = stat.st_ino, 0
+            if since and (index := self.load_index())['inode'] == stat.st_ino:
+                day = since.date().isoformat()
+                self.offset = max([offset for name, offset in index['days'].items() if name <= day], default=0)
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b'\n'):  # Record is being written
+                    break
+                self.offset += len(line)
+                if (header := (record := self.decode(line))[0]) and (since is None or header['utc'] > since):
+                    records.append(record)
+        return records
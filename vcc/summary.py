@@ -1,11 +1,25 @@
+import logging
 from datetime import datetime, timedelta
 
 from vcc import settings, json_decoder
 from vcc.client import VCC
 from vcc.session import Session
+from vcc.skd import find_schedule, local_summary
 
 masters = ['all', 'std', 'int']
 
+logger = logging.getLogger('vcc')
+
+
+# Scheduled stations from local schedule file. None if file is not available or cannot be read
+def read_local(ses_id):
+    if path := find_schedule(ses_id):
+        try:
+            return local_summary(path)['scheduled']
+        except Exception as exc:
+            logger.warning(f'local summary of {path.name} failed [{str(exc)}]')
+    return None
+
 
 def summary(sta_id, begin, end):
     with VCC() as vcc:
@@ -17,12 +31,16 @@ def summary(sta_id, begin, end):
         for session in sessions:
             if sta_id in session.included:
                 print(f'{session.code.lower()}', end=' ')
-                rsp = vcc.get(f'/schedules/{session.code.lower()}', params={'select': 'summary'})
-                if rsp:
-                    scans = {info['station']: info['nbr_scans'] for info in json_decoder(rsp.json())['scheduled']}
-                    print(scans.get(sta_id, 'N/A'))
-                else:
+                # Use local schedule file when available
+                scheduled = read_local(session.code)
+                if scheduled is None and (rsp := vcc.get(f'/schedules/{session.code.lower()}',
+                                                         params={'select': 'summary'})):
+                    scheduled = json_decoder(rsp.json())['scheduled']
+                if scheduled is None:
                     print('N/A')
+                    continue
+                scans = {info['station']: info['nbr_scans'] for info in scheduled}
+                print(scans.get(sta_id, 'N/A'))
 
 
 def main():
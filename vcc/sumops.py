@@ -5,6 +5,8 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from collections import defaultdict, namedtuple
 from operator import itemgetter
+from bisect import bisect_left
+from itertools import accumulate
 import json
 
 import tkinter as tk
@@ -15,7 +17,7 @@ from vcc.session import Session
 from vcc.client import VCC
 from vcc.ns import get_ddout_log
 from vcc.xwidget import XEntry, XCombobox, XMenu, FakeEntry
-from vcc.skd import SKD, VEX
+from vcc.skd import SKD, read_schedule, utc
 
 
 def SumOps(ses_id):
@@ -118,6 +120,8 @@ class Scans:
     def __init__(self, group, ses_id, sta_id, schedule):
         self.ses_id, self.sta_id = ses_id.lower(), sta_id.lower()
         self.data, self.names = defaultdict(list), []
+        self.index, self.timed, self.ends = {}, [], []
+        self.start = self.end = None
         if isinstance(schedule, SKD):
             self.extract(schedule)
             return
@@ -150,11 +154,12 @@ class Scans:
         with open(self.path) as snp:
             for line in snp.read().splitlines():
                 if line.startswith('!'):
-                    utc = datetime.strptime(line, '!%Y.%j.%H:%M:%S')
+                    timestamp = utc(snap=line)
                 elif line.startswith('scan_name'):
                     self.names.append(name := line[10:].split(',')[0])
                 elif line.startswith('data_valid'):
-                    self.data[name].append(utc)
+                    self.data[name].append(timestamp)
+        self.make_index()
 
     def extract(self, skd):
         sta_id = self.sta_id.capitalize()
@@ -166,45 +171,57 @@ class Scans:
             self.names.append(name)
             self.data[name] = [data['start'],
                                data['start'] + timedelta(seconds=data['station_codes'][sta_id]['duration'])]
+        self.make_index()
+
+    # Position of each scan name and end times of scans with times. Ends are kept as running maximum
+    # so that the first scan ending after a time is found by bisection.
+    def make_index(self):
+        self.index = {name: index for index, name in enumerate(self.names)}
+        times = [(name, values[0], values[-1]) for name in self.names if (values := self.data.get(name))]
+        self.timed = [name for name, _, _ in times]
+        self.ends = list(accumulate([end for _, _, end in times], max))
+        if times:
+            self.start, self.end = min([start for _, start, _ in times]), self.ends[-1]
 
     def read_schedule(self, sta_id, ext):
-        cls = VEX if ext == '.vex' else SKD
-        with cls(self.path) as skd:
-            skd.read()
-            self.extract(skd)
+        self.extract(read_schedule(self.path))
 
     def is_empty(self):
         return len(self.names) == 0
 
     def __getitem__(self, name):
-        return name if name in self.names else {'start': self.names[0], 'end': self.names[-1]
-                                                }.get(name, self.get_scan_from_time(name))
+        if name in self.index:
+            return name
+        if name in ('start', 'end'):
+            return self.names[0] if name == 'start' else self.names[-1]
+        return self.get_scan_from_time(name)
 
     def __len__(self):
         return len(self.names)
 
+    # First scan ending after time (HH:MM) during the session
     def get_scan_from_time(self, hm):
-        if not self.is_utc(hm):
+        if not isinstance(hm, str) or not self.is_utc(hm) or not self.timed:
+            return None
+        start, end = self.start, self.end
+        try:
+            if (t := datetime.strptime(f"{start.strftime('%Y.%j')}.{hm}", "%Y.%j.%H:%M")) < start:
+                t = datetime.strptime(f"{end.strftime('%Y.%j')}.{hm}", "%Y.%j.%H:%M")
+        except ValueError:
             return None
-        start, end = self.session.start, self.session.end
-        if (t := datetime.strptime(f"{start.strftime('%Y.%j')}.{hm}", "%Y.%j.%H:%M")) < start:
-            t = datetime.strptime(f"{end.strftime('%Y.%j')}.{hm}", "%Y.%j.%H:%M")
         if t > end:
             return None
-        for name,  [_, end] in self.data.items():
-            if t <= end:
-                return name
-        return self.names[-1]
+        return self.timed[bisect_left(self.ends, t)]
 
     def slice(self, first, last):
-        first, last = self[first], self[last]
-        return self.names[self.names.index(first):self.names.index(last)+1]
+        if (first := self.index.get(self[first])) is None or (last := self.index.get(self[last])) is None:
+            return []
+        return self.names[first:last+1]
 
     def nbr(self, first, last):
-        first, last = self[first], self[last]
-        if first is None or last is None:
+        if (first := self.index.get(self[first])) is None or (last := self.index.get(self[last])) is None:
             return ''
-        return self.names.index(last) - self.names.index(first) + 1
+        return last - first + 1
 
 
 class Info(ttk.LabelFrame):
@@ -465,11 +482,10 @@ class SessionReportWnd(tk.Tk):
                     break
             else:
                 raise ValidationError('Session', f'SKD or VEX files for {self.ses_id}')
-        with (VEX if path.suffix == '.vex' else SKD)(path) as sched:
-            sched.read()
-            self.session = Session({'code': self.ses_id, 'start': sched.start,
-                                    'duration': int((sched.end - sched.start).total_seconds())})
-            self.scans = Scans(self.group, self.ses_id, self.sta_id, sched)
+        sched = read_schedule(path)
+        self.session = Session({'code': self.ses_id, 'start': sched.start,
+                                'duration': int((sched.end - sched.start).total_seconds())})
+        self.scans = Scans(self.group, self.ses_id, self.sta_id, sched)
         for rec in self.unsent.get(self.ses_id, self.sta_id):
             if rec['issue'] == 'ok':
                 self.ok_id = rec['id']